@@ -1,10 +1,11 @@
 import argparse
 import csv
 import json
-import math
+from functools import partial
 from pathlib import Path
-from typing import List, Dict, Any
-from tqdm import tqdm
+from typing import Dict, Any, Optional
+
+from json_scan import confusion_counts, scan, write_metrics_into
 
 DEFAULT_THR = 0.6170
 
@@ -15,87 +16,27 @@ CSV_FIELDS = [
     "sample_pos", "sample_neg", "rows"
 ]
 
-def family_from_name(name: str) -> str:
-    try:
-        s = (name or "").strip().lower()
-        i = s.find("___")
-        return s[:i] if i > 0 else ""
-    except Exception:
-        return ""
-
-def metrics_from_counts(tp: int, fp: int, tn: int, fn: int) -> Dict[str, float]:
-
-    pos = tp + fn
-    neg = tn + fp
-    tpr = tp / pos if pos else 0.0
-    fpr = fp / neg if neg else 0.0
-    prec = tp / (tp + fp) if (tp + fp) else 0.0
-    spec = tn / neg if neg else 0.0
-    acc  = (tp + tn) / (pos + neg) if (pos + neg) else 0.0
-    f1   = (2 * tp) / (2 * tp + fp + fn) if (2 * tp + fp + fn) else 0.0
-    j    = tpr - fpr
-    return {
-        "tpr": tpr, "fpr": fpr, "precision": prec, "specificity": spec,
-        "accuracy": acc, "f1": f1, "youdenJ": j,
-        "sample_pos": pos, "sample_neg": neg
-    }
-
 def evaluate_overall_from_json_dir(json_dir: Path,
                                    threshold: float,
-                                   progress: bool = True) -> Dict[str, Any]:
-
-    tp = fp = tn = fn = rows = 0
-
-    files = sorted([p for p in json_dir.glob("*.json") if p.is_file()])
-    iterator = tqdm(files, desc="Scanning JSONs", unit="file") if progress else files
-
-    for jf in iterator:
-        try:
-            with open(jf, "r", encoding="utf-8") as f:
-                data = json.load(f)
-
-            if not isinstance(data, list) or not data:
-                continue
-
-            anchor = (data[0] or {}).get("secondFileName", "")
-            src_family = family_from_name(anchor)
-            if not src_family:
-                continue
-
-            for rec in data:
-                dst_family = family_from_name(rec.get("fileName", ""))
-                y = 1 if (dst_family and dst_family == src_family) else 0
-
-                s = rec.get("score_weighted", None)
-                try:
-                    s = float(s)
-                except Exception:
-                    continue
-                if not math.isfinite(s):
-                    continue
+                                   progress: bool = True,
+                                   workers: Optional[int] = None,
+                                   parquet: bool = False) -> Dict[str, Any]:
 
-                pred = 1 if s >= threshold else 0
-                if pred == 1 and y == 1:
-                    tp += 1
-                elif pred == 1 and y == 0:
-                    fp += 1
-                elif pred == 0 and y == 0:
-                    tn += 1
-                else:
-                    fn += 1
-                rows += 1
+    tp = fp = tn = fn = 0
 
-        except Exception:
-            continue
+    consumers = [partial(confusion_counts, threshold=threshold)]
+    for _, (c,) in scan(json_dir, consumers, progress=progress, workers=workers, parquet=parquet):
+        tp += c[0]; fp += c[1]; tn += c[2]; fn += c[3]
+    rows = tp + fp + tn + fn
 
-    m = metrics_from_counts(tp, fp, tn, fn)
-    return {
+    row: Dict[str, Any] = {
         "scope": "ALL_JSONS",
         "threshold": threshold,
         "tp": tp, "fp": fp, "tn": tn, "fn": fn,
-        **m,
-        "rows": rows,
     }
+    write_metrics_into(row, tp, fp, tn, fn)
+    row["rows"] = rows
+    return row
 
 def write_csv_single(row: Dict[str, Any], out_csv: Path):
     with open(out_csv, "w", newline="", encoding="utf-8") as f:
@@ -108,21 +49,27 @@ def main():
     ap = argparse.ArgumentParser(
         description="Overall metrics @ fixed threshold from JSON folder (uses score_weighted)."
     )
-    ap.add_argument("--json-dir", required=True, type=Path,
-                    help="Folder with *.json files (each: array of comparisons)")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--json-dir", type=Path,
+                     help="Folder with *.json files (each: array of comparisons)")
+    src.add_argument("--parquet-dir", type=Path,
+                     help="Parquet dataset from jsons_to_parquet.py (instead of --json-dir)")
     ap.add_argument("--threshold", type=float, default=DEFAULT_THR,
                     help=f"Operating threshold (default: {DEFAULT_THR:.4f})")
     ap.add_argument("--out-csv", type=Path, default=None,
                     help="Output CSV (default: _perf_overall_json.csv next to this script)")
     ap.add_argument("--no-progress", action="store_true",
                     help="Disable progress bar")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="Worker processes (default: all cores)")
     args = ap.parse_args()
 
     script_dir = Path(__file__).resolve().parent
     out_csv = args.out_csv or (script_dir / "_perf_overall_json.csv")
 
     row = evaluate_overall_from_json_dir(
-        args.json_dir, args.threshold, progress=not args.no_progress
+        args.parquet_dir or args.json_dir, args.threshold, progress=not args.no_progress,
+        workers=args.workers, parquet=args.parquet_dir is not None
     )
     write_csv_single(row, out_csv)
     print(json.dumps(row, indent=2))
@@ -1,11 +1,12 @@
 import argparse
 import csv
-import json
-import math
-from collections import Counter, defaultdict
+import heapq
+from collections import defaultdict
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Set, Tuple
-from tqdm import tqdm
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from json_scan import fp_dst_counts, scan
 
 DEFAULT_THR = 0.6170
 
@@ -16,91 +17,63 @@ DEFAULT_FAMILIES: List[str] = [
 
 PAIR_FIELDS = ["src_family", "dst_family", "fp_count", "threshold"]
 
-def family_from_name(name: str) -> str:
-    s = (name or "").strip().lower()
-    i = s.find("___")
-    return s[:i] if i > 0 else ""
-
 def collect_fp_pairs(json_dir: Path,
                      families_filter: Set[str],
                      threshold: float,
                      include_unknown: bool,
-                     progress: bool = True) -> Tuple[Counter, Set[str], Set[str]]:
+                     progress: bool = True,
+                     workers: Optional[int] = None,
+                     parquet: bool = False) -> Tuple[Dict[str, Dict[str, int]], Set[str], Set[str]]:
 
-    pairs = Counter()
+    pairs: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
     src_set, dst_set = set(), set()
 
-    files = sorted(p for p in json_dir.glob("*.json") if p.is_file())
-    it = tqdm(files, desc="Scanning JSONs", unit="file") if progress else files
-
-    for jf in it:
-        try:
-            data = json.load(open(jf, "r", encoding="utf-8"))
-            if not isinstance(data, list) or not data:
-                continue
-
-            src_family = family_from_name((data[0] or {}).get("secondFileName", ""))
-            if not src_family:
-                continue
-            if families_filter and src_family not in families_filter:
-                continue
-
-            for rec in data:
-                dst_family = family_from_name(rec.get("fileName", ""))
-                if not dst_family:
-                    if not include_unknown:
-                        continue
-                    dst_family = "__unknown__"
-
-                s = rec.get("score_weighted", None)
-                try:
-                    s = float(s)
-                except Exception:
-                    continue
-                if not math.isfinite(s):
-                    continue
-
-                pred_pos = s >= threshold
-                is_pos = (dst_family == src_family)
-                if pred_pos and not is_pos:
-                    pairs[(src_family, dst_family)] += 1
-                    src_set.add(src_family)
-                    dst_set.add(dst_family)
-        except Exception:
+    consumers = [partial(fp_dst_counts, threshold=threshold, include_unknown=include_unknown)]
+    for src_family, (cnt,) in scan(json_dir, consumers, fam_filter=families_filter or None,
+                                   progress=progress, workers=workers, parquet=parquet):
+        if not cnt:
             continue
+        row = pairs[src_family]
+        for dst_family, c in cnt.items():
+            row[dst_family] += c
+        src_set.add(src_family)
+        dst_set.update(cnt)
 
     return pairs, src_set, dst_set
 
-def write_pairs_csv(pairs: Counter, out_csv: Path, threshold: float):
-    with open(out_csv, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=PAIR_FIELDS)
-        w.writeheader()
-        for (src, dst), cnt in sorted(pairs.items(), key=lambda kv: (-kv[1], kv[0][0], kv[0][1])):
-            w.writerow({
-                "src_family": src,
-                "dst_family": dst,
-                "fp_count": cnt,
-                "threshold": threshold,
-            })
-
-def write_matrix_csv(pairs: Counter, srcs: Set[str], dsts: Set[str], out_csv: Path):
+def _pair_sort_key(item: Tuple[str, str, int]):
+    src, dst, cnt = item
+    return -cnt, src, dst
+
+def flatten_pairs(pairs: Dict[str, Dict[str, int]]) -> Iterator[Tuple[str, str, int]]:
+    for src, row in pairs.items():
+        for dst, cnt in row.items():
+            yield src, dst, cnt
+
+def write_pairs_csv(pairs: Dict[str, Dict[str, int]], out_csv: Path, threshold: float):
+    with open(out_csv, "w", newline="", encoding="utf-8", buffering=1 << 20) as f:
+        w = csv.writer(f)
+        w.writerow(PAIR_FIELDS)
+        w.writerows((src, dst, cnt, threshold)
+                    for src, dst, cnt in sorted(flatten_pairs(pairs), key=_pair_sort_key))
+
+def write_matrix_csv(pairs: Dict[str, Dict[str, int]], srcs: Set[str], dsts: Set[str], out_csv: Path):
     src_list = sorted(srcs)
     dst_list = sorted(dsts)
-    # Build matrix map
-    mat: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
-    for (src, dst), cnt in pairs.items():
-        mat[dst][src] = cnt
+    # pairs is already keyed src -> dst, so columns come straight from it
+    cols = [pairs.get(src, {}) for src in src_list]
 
-    with open(out_csv, "w", newline="", encoding="utf-8") as f:
+    with open(out_csv, "w", newline="", encoding="utf-8", buffering=1 << 20) as f:
         writer = csv.writer(f)
         writer.writerow(["dst \\ src"] + src_list)
-        for dst in dst_list:
-            row = [dst] + [mat[dst].get(src, 0) for src in src_list]
-            writer.writerow(row)
+        writer.writerows([dst] + [col.get(dst, 0) for col in cols] for dst in dst_list)
 
 def main():
     ap = argparse.ArgumentParser(description="List FP pairs (src→dst) and optional matrix from JSON folder.")
-    ap.add_argument("--json-dir", required=True, type=Path, help="Folder with *.json files")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--json-dir", type=Path, help="Folder with *.json files")
+    src.add_argument("--parquet-dir", type=Path,
+                     help="Parquet dataset from jsons_to_parquet.py (instead of --json-dir)")
     ap.add_argument("--threshold", type=float, default=DEFAULT_THR, help="Operating threshold (default: 0.6170)")
     ap.add_argument("--families", type=str, nargs="*", default=DEFAULT_FAMILIES,
                     help="Anchor families to include (prefix before '___'). Use --all-anchors to include all found.")
@@ -113,6 +86,7 @@ def main():
     ap.add_argument("--out-matrix-csv", type=Path, default=None,
                     help="Optional pivot matrix CSV (dst rows × src columns)")
     ap.add_argument("--top", type=int, default=25, help="Print top-N pairs to stdout")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
     args = ap.parse_args()
 
     script_dir = Path(__file__).resolve().parent
@@ -121,16 +95,17 @@ def main():
     fam_filter = set() if args.all_anchors else {f.strip().lower() for f in args.families if f.strip()}
 
     pairs, srcs, dsts = collect_fp_pairs(
-        args.json_dir, fam_filter, args.threshold, include_unknown=args.include_unknown, progress=True
+        args.parquet_dir or args.json_dir, fam_filter, args.threshold, include_unknown=args.include_unknown,
+        progress=True, workers=args.workers, parquet=args.parquet_dir is not None
     )
     write_pairs_csv(pairs, out_pairs, args.threshold)
 
     if args.out_matrix_csv:
         write_matrix_csv(pairs, srcs, dsts, args.out_matrix_csv)
 
-    top_n = sorted(pairs.items(), key=lambda kv: (-kv[1], kv[0][0], kv[0][1]))[:max(args.top, 0)]
+    top_n = heapq.nsmallest(max(args.top, 0), flatten_pairs(pairs), key=_pair_sort_key)
     print(f"Top {len(top_n)} FP pairs (threshold={args.threshold}):")
-    for (src, dst), c in top_n:
+    for src, dst, c in top_n:
         print(f"{src:20s} -> {dst:20s}  {c}")
     print(f"[OK] Wrote pairs -> {out_pairs.resolve()}")
     if args.out_matrix_csv:
@@ -1,12 +1,11 @@
 import argparse
 import csv
-import json
-import math
 from collections import Counter, defaultdict
+from functools import partial
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 
-from tqdm import tqdm
+from json_scan import fp_dst_counts, scan
 
 DEFAULT_THR = 0.6170
 
@@ -32,87 +31,51 @@ DEFAULT_FAMILIES: List[str] = [
 CSV_FIELDS = ["src_family", "dst_family", "fp_count", "threshold"]
 
 
-def family_from_name(name: str) -> str:
-    s = (name or "").strip().lower()
-    i = s.find("___")
-    return s[:i] if i > 0 else ""
-
-
 def collect_fp_families(json_dir: Path,
                         families: List[str],
                         threshold: float,
-                        progress: bool = True) -> Dict[str, Counter]:
+                        progress: bool = True,
+                        workers: Optional[int] = None,
+                        parquet: bool = False) -> Dict[str, Counter]:
     fam_set = {f.strip().lower() for f in families if f.strip()}
     fp_counts: Dict[str, Counter] = defaultdict(Counter)
 
-    files = sorted([p for p in json_dir.glob("*.json") if p.is_file()])
-    it = tqdm(files, desc="Scanning JSONs", unit="file") if progress else files
-
-    for jf in it:
-        try:
-            with open(jf, "r", encoding="utf-8") as fh:
-                data = json.load(fh)
-            if not isinstance(data, list) or not data:
-                continue
-
-            anchor = data[0].get("secondFileName", "")
-            src_family = family_from_name(anchor)
-            if src_family not in fam_set:
-                continue
-
-            cnt = fp_counts[src_family]
-            for rec in data:
-                dst_family = family_from_name(rec.get("fileName", ""))
-                dst_family_norm = dst_family if dst_family else "__unknown__"
-
-                s = rec.get("score_weighted", None)
-                try:
-                    s = float(s)
-                except Exception:
-                    continue
-                if not math.isfinite(s):
-                    continue
-
-                pred_pos = s >= threshold
-                is_pos = (dst_family and dst_family == src_family)
-                if pred_pos and not is_pos:
-                    cnt[dst_family_norm] += 1
-
-        except Exception:
-            continue
+    consumers = [partial(fp_dst_counts, threshold=threshold)]
+    for src_family, (cnt,) in scan(json_dir, consumers, fam_filter=fam_set,
+                                   progress=progress, workers=workers, parquet=parquet):
+        fp_counts[src_family].update(cnt)
 
     return fp_counts
 
 
 def write_fp_csv(fp_counts: Dict[str, Counter], out_csv: Path, threshold: float):
-    with open(out_csv, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=CSV_FIELDS)
-        w.writeheader()
+    with open(out_csv, "w", newline="", encoding="utf-8", buffering=1 << 20) as f:
+        w = csv.writer(f)
+        w.writerow(CSV_FIELDS)
         for src_family in sorted(fp_counts.keys()):
             items = sorted(fp_counts[src_family].items(), key=lambda kv: (-kv[1], kv[0]))
-            for dst_family, c in items:
-                w.writerow({
-                    "src_family": src_family,
-                    "dst_family": dst_family,
-                    "fp_count": c,
-                    "threshold": threshold,
-                })
+            w.writerows((src_family, dst_family, c, threshold) for dst_family, c in items)
 
 
 def main():
     ap = argparse.ArgumentParser(description="Collect FP target families per anchor family from JSON folder.")
-    ap.add_argument("--json-dir", required=True, type=Path, help="Folder with *.json files (each: array of comparisons)")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--json-dir", type=Path, help="Folder with *.json files (each: array of comparisons)")
+    src.add_argument("--parquet-dir", type=Path,
+                     help="Parquet dataset from jsons_to_parquet.py (instead of --json-dir)")
     ap.add_argument("--threshold", type=float, default=DEFAULT_THR, help="Operating threshold (default: 0.6170)")
     ap.add_argument("--families", type=str, nargs="*", default=DEFAULT_FAMILIES,
                     help="Anchor families to include (prefix before '___' in secondFileName)")
     ap.add_argument("--out-csv", type=Path, default=None,
                     help="Output CSV (default: _fp_by_family_json.csv next to this script)")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
     args = ap.parse_args()
 
     script_dir = Path(__file__).resolve().parent
     out_csv = args.out_csv or (script_dir / "_fp_by_family_json.csv")
 
-    fp_counts = collect_fp_families(args.json_dir, args.families, args.threshold, progress=True)
+    fp_counts = collect_fp_families(args.parquet_dir or args.json_dir, args.families, args.threshold,
+                                    progress=True, workers=args.workers, parquet=args.parquet_dir is not None)
     write_fp_csv(fp_counts, out_csv, args.threshold)
     print(f"[OK] Wrote FP families -> {out_csv.resolve()}")
 
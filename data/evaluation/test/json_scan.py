@@ -0,0 +1,292 @@
+"""
+Shared scan over a folder of per-anchor comparison JSONs for the eval_* scripts.
+
+Each JSON file is an array of comparisons of one anchor (secondFileName) against
+every DB file (fileName), carrying a score_weighted value. A file is parsed once
+in a worker process and reduced to (src_family, dst_codes, scores); every
+consumer passed to scan() then aggregates that view, so several reports can be
+computed from a single decode of the folder.
+
+Consumers are called as fn(src_family, dst_codes, scores) in the worker and must
+be picklable (module-level functions or functools.partial of them). dst_codes
+are int32 ids from family_code(); they are only valid inside the process that
+made them, so consumers resolve them (family_names) before returning.
+
+The same consumers also run over the Parquet dataset written by
+jsons_to_parquet.py (scan(..., parquet=True)), one hive partition fragment at a
+time, which skips JSON decoding entirely.
+"""
+
+import json
+import math
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except Exception:
+    HAS_ORJSON = False
+
+try:
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    HAS_ARROW = True
+except Exception:
+    HAS_ARROW = False
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except Exception:
+    HAS_NUMBA = False
+
+FAMILY_SEP = "___"
+UNKNOWN_FAMILY = "__unknown__"
+
+# records start with fileName, secondFileName, so the anchor sits in the first bytes
+PEEK_BYTES = 4096
+_ANCHOR_RE = re.compile(rb'"secondFileName"\s*:\s*"([^"\\]*)"')
+
+Consumer = Callable[[str, np.ndarray, np.ndarray], object]
+
+
+def load_json(path: Path):
+    raw = path.read_bytes()
+    if HAS_ORJSON:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass  # e.g. bare NaN tokens, which only the stdlib parser accepts
+    return json.loads(raw)
+
+
+@lru_cache(maxsize=16384)
+def family_from_name(name: str) -> str:
+    # only the prefix is stripped/lowered; underscores are never whitespace, so the
+    # first separator sits at the same place as in name.strip().lower()
+    i = name.find(FAMILY_SEP) if name else -1
+    return name[:i].lstrip().lower() if i > 0 else ""
+
+
+def _to_float(v) -> float:
+    try:
+        return float(v)
+    except Exception:
+        return math.nan
+
+
+def scores_array(data: List[dict]) -> np.ndarray:
+    vals = [rec.get("score_weighted", None) for rec in data]
+    try:
+        # None and numeric strings convert in bulk; anything else falls back per value
+        return np.asarray(vals, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.fromiter((_to_float(v) for v in vals), dtype=np.float64, count=len(vals))
+
+
+# family -> small int id; each worker process grows its own table, so codes
+# never leave the process that assigned them (consumers return names)
+_fam_index: Dict[str, int] = {}
+_fam_names: List[str] = []
+
+
+def family_code(fam: str) -> int:
+    code = _fam_index.get(fam)
+    if code is None:
+        code = _fam_index[fam] = len(_fam_names)
+        _fam_names.append(fam)
+    return code
+
+
+def family_names(codes: np.ndarray) -> np.ndarray:
+    return np.asarray(_fam_names, dtype=object)[codes]
+
+
+def family_codes(data: List[dict]) -> np.ndarray:
+    return np.fromiter((family_code(family_from_name(rec.get("fileName", ""))) for rec in data),
+                       dtype=np.int32, count=len(data))
+
+
+# confusion cells are indexed by (pred << 1) | y: 0=tn, 1=fn, 2=fp, 3=tp
+
+if HAS_NUMBA:
+    # no fastmath: it would let LLVM assume the NaN scores away
+    @njit(cache=True)
+    def _tally_jit(scores, y, threshold):
+        cnt = np.zeros(4, dtype=np.int64)
+        for i in range(scores.size):
+            s = scores[i]
+            if np.isfinite(s):
+                cnt[(int(s >= threshold) << 1) | int(y[i])] += 1
+        return cnt[3], cnt[2], cnt[0], cnt[1]
+
+
+def tally(scores: np.ndarray, y: np.ndarray, threshold: float) -> Tuple[int, int, int, int]:
+    if HAS_NUMBA:
+        tp, fp, tn, fn = _tally_jit(scores, y, threshold)
+        return int(tp), int(fp), int(tn), int(fn)
+    finite = np.isfinite(scores)
+    pred = scores[finite] >= threshold
+    idx = (pred.view(np.int8) << 1) | y[finite].view(np.int8)
+    cnt = np.bincount(idx, minlength=4)
+    return int(cnt[3]), int(cnt[2]), int(cnt[0]), int(cnt[1])
+
+
+# ---------- consumers ----------
+
+def confusion_counts(src_family: str, dst_codes: np.ndarray, scores: np.ndarray,
+                     threshold: float) -> Tuple[int, int, int, int]:
+    return tally(scores, dst_codes == family_code(src_family), threshold)
+
+
+def fp_dst_counts(src_family: str, dst_codes: np.ndarray, scores: np.ndarray,
+                  threshold: float, include_unknown: bool = True) -> Dict[str, int]:
+    fp_mask = np.isfinite(scores) & (scores >= threshold) & (dst_codes != family_code(src_family))
+    if not include_unknown:
+        fp_mask &= (dst_codes != family_code(""))
+
+    hist = np.bincount(dst_codes[fp_mask])
+    cnt: Dict[str, int] = {}
+    for code in np.flatnonzero(hist):
+        cnt[_fam_names[code] or UNKNOWN_FAMILY] = int(hist[code])
+    return cnt
+
+
+def file_columns(src_family: str, dst_codes: np.ndarray, scores: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return family_names(dst_codes), scores
+
+
+# ---------- metrics ----------
+
+def write_metrics_into(row: dict, tp: int, fp: int, tn: int, fn: int) -> None:
+    pos = tp + fn
+    neg = tn + fp
+    row["tpr"] = tpr = tp / pos if pos else 0.0
+    row["fpr"] = fpr = fp / neg if neg else 0.0
+    row["precision"]   = tp / (tp + fp) if (tp + fp) else 0.0
+    row["specificity"] = tn / neg if neg else 0.0
+    row["accuracy"]    = (tp + tn) / (pos + neg) if (pos + neg) else 0.0
+    row["f1"]          = (2 * tp) / (2 * tp + fp + fn) if (2 * tp + fp + fn) else 0.0
+    row["youdenJ"]     = tpr - fpr
+    row["sample_pos"]  = pos
+    row["sample_neg"]  = neg
+
+
+# ---------- scan ----------
+
+def list_json_files(json_dir: Path) -> List[Path]:
+    # scandir's is_file() uses the cached dirent type, so no stat per entry
+    with os.scandir(json_dir) as it:
+        files = [e.path for e in it if e.name.endswith(".json") and e.is_file()]
+    files.sort()
+    return [Path(p) for p in files]
+
+
+def peek_src_family(jf: Path) -> Optional[str]:
+    """Anchor family from the head of the file, or None if it can't be read off cheaply."""
+    with open(jf, "rb") as f:
+        head = f.read(PEEK_BYTES)
+    m = _ANCHOR_RE.search(head)
+    if m is None:
+        return None
+    try:
+        return family_from_name(m.group(1).decode("utf-8"))
+    except UnicodeDecodeError:
+        return None
+
+
+def read_file(jf: Path, fam_filter: Optional[Set[str]] = None) -> Optional[Tuple[str, np.ndarray, np.ndarray]]:
+    if fam_filter is not None:
+        src_family = peek_src_family(jf)
+        if src_family is not None and src_family not in fam_filter:
+            return None
+
+    data = load_json(jf)
+    if not isinstance(data, list) or not data:
+        return None
+
+    src_family = family_from_name((data[0] or {}).get("secondFileName", ""))
+    if not src_family:
+        return None
+    if fam_filter is not None and src_family not in fam_filter:
+        return None
+
+    return src_family, family_codes(data), scores_array(data)
+
+
+def _process_one(jf: Path,
+                 consumers: Tuple[Consumer, ...],
+                 fam_filter: Optional[Set[str]]) -> Optional[Tuple[str, list]]:
+    try:
+        rec = read_file(jf, fam_filter)
+        if rec is None:
+            return None
+        return rec[0], [fn(*rec) for fn in consumers]
+    except Exception:
+        return None
+
+
+def scan_parquet(parquet_dir: Path,
+                 consumers: Sequence[Consumer],
+                 fam_filter: Optional[Set[str]] = None,
+                 progress: bool = True) -> Iterator[Tuple[str, list]]:
+    if not HAS_ARROW:
+        raise RuntimeError("pyarrow is required to read a Parquet dataset")
+
+    dset = ds.dataset(str(parquet_dir), format="parquet", partitioning="hive")
+    frags = []
+    for frag in dset.get_fragments():
+        src_family = ds.get_partition_keys(frag.partition_expression).get("src_family", "")
+        if not src_family:
+            continue
+        if fam_filter is not None and src_family not in fam_filter:
+            continue
+        frags.append((src_family, frag))
+
+    if progress:
+        frags = tqdm(frags, desc="Scanning Parquet", unit="frag", mininterval=0.5, smoothing=0)
+    for src_family, frag in frags:
+        t = frag.to_table(columns=["dst_family", "score_weighted"])
+        dst = pc.dictionary_encode(t.column(0)).combine_chunks()
+        lut = np.fromiter((family_code(f) for f in dst.dictionary.to_pylist()), dtype=np.int32)
+        dst_codes = lut[dst.indices.to_numpy(zero_copy_only=False)]
+        scores = t.column(1).to_numpy(zero_copy_only=False)
+        yield src_family, [fn(src_family, dst_codes, scores) for fn in consumers]
+
+
+def scan(json_dir: Path,
+         consumers: Sequence[Consumer],
+         fam_filter: Optional[Set[str]] = None,
+         progress: bool = True,
+         workers: Optional[int] = None,
+         parquet: bool = False) -> Iterator[Tuple[str, list]]:
+    """
+    Yield (src_family, [consumer results]) for every usable JSON in json_dir.
+
+    fam_filter=None keeps every anchor with a known family; a set keeps only
+    anchors whose family is in it. Unreadable or empty files are skipped.
+    With parquet=True, json_dir is a dataset written by jsons_to_parquet.py.
+    """
+    if parquet:
+        yield from scan_parquet(json_dir, consumers, fam_filter, progress)
+        return
+
+    files = list_json_files(json_dir)
+
+    worker = partial(_process_one, consumers=tuple(consumers), fam_filter=fam_filter)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as ex:
+        results = ex.map(worker, files, chunksize=32)
+        if progress:
+            results = tqdm(results, total=len(files), desc="Scanning JSONs", unit="file",
+                           mininterval=0.5, miniters=128, smoothing=0)
+        for res in results:
+            if res is not None:
+                yield res
@@ -0,0 +1,91 @@
+import argparse
+import json
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from json_scan import file_columns, scan
+
+PARTITION_COL = "src_family"
+LABEL_COL     = "label_same_family"
+
+OUT_SCHEMA = pa.schema([
+    pa.field(PARTITION_COL, pa.string()),
+    pa.field("dst_family", pa.string()),
+    pa.field("score_weighted", pa.float64()),
+    pa.field(LABEL_COL, pa.int8()),
+])
+
+
+def _batches(json_dir: Path, stats: dict, progress: bool, workers: Optional[int]) -> Iterator[pa.RecordBatch]:
+    for src_family, ((dst_fams, scores),) in scan(json_dir, [file_columns], progress=progress, workers=workers):
+        n = len(scores)
+        stats["files"] += 1
+        stats["rows"] += n
+        yield pa.record_batch([
+            pa.array([src_family] * n, type=pa.string()),
+            pa.array(dst_fams, type=pa.string()),
+            pa.array(scores, type=pa.float64()),
+            pa.array((dst_fams == src_family).astype(np.int8), type=pa.int8()),
+        ], schema=OUT_SCHEMA)
+
+
+def convert(json_dir: Path, out_dir: Path, progress: bool = True, workers: Optional[int] = None) -> dict:
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    fmt = ds.ParquetFileFormat()
+    wopts = fmt.make_write_options(compression="snappy")
+    stats = {"files": 0, "rows": 0}
+
+    ds.write_dataset(
+        _batches(json_dir, stats, progress, workers),
+        base_dir=str(out_dir),
+        schema=OUT_SCHEMA,
+        format=fmt,
+        partitioning=ds.partitioning(
+            pa.schema([pa.field(PARTITION_COL, pa.string())]),
+            flavor="hive"
+        ),
+        existing_data_behavior="delete_matching",
+        file_options=wopts,
+        min_rows_per_group=64_000,
+        max_rows_per_file=2_000_000,
+        create_dir=True,
+        use_threads=True,
+    )
+
+    meta = {
+        "json_dir": str(json_dir),
+        "output_dir": str(out_dir),
+        "partition_col": PARTITION_COL,
+        "label_col": LABEL_COL,
+        "output_schema": [f"{f.name}:{f.type}" for f in OUT_SCHEMA],
+        "files_read": stats["files"],
+        "rows_written": stats["rows"],
+    }
+    with open(out_dir / "_meta_jsons_to_parquet.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    return meta
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Flatten a JSON comparison folder into a Parquet dataset (hive: src_family=...) "
+                    "that the eval_* scripts can read with --parquet-dir."
+    )
+    ap.add_argument("--json-dir", required=True, type=Path, help="Folder with *.json files (each: array of comparisons)")
+    ap.add_argument("--out-dir", required=True, type=Path, help="Output Parquet dataset directory")
+    ap.add_argument("--no-progress", action="store_true", help="Disable progress bar")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    args = ap.parse_args()
+
+    meta = convert(args.json_dir, args.out_dir, progress=not args.no_progress, workers=args.workers)
+    print(json.dumps(meta, indent=2, ensure_ascii=False))
+    print(f"[OK] Wrote Parquet dataset -> {args.out_dir.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
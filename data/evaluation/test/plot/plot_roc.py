@@ -1,97 +1,117 @@
-import argparse, csv, math
+import argparse, hashlib, json, math, os, sys
 from pathlib import Path
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import pyarrow.dataset as ds
+import matplotlib
+matplotlib.use("Agg")  # batch PNG export, no GUI backend
 import matplotlib.pyplot as plt
-from sklearn.metrics import roc_curve, auc
 
-FAMILY_COL = "src_family"
-LABEL_COL  = "label_same_family"
-COL_SM     = "rep_string_minhash"
-COL_CR     = "rep_code_regions"
-COL_PH     = "rep_program_header"
-
-TAU_SM = 0.146484375
-TAU_CR = 0.3988839387893677
-TAU_PH = 0.8291192054748535
-
-W_SM = 0.6170
-W_PH = 0.0884
-W_CR = 0.2946
-
-def scan_weighted_scores(dataset: ds.Dataset,
-                         family: str | None,
-                         batch_size: int = 128_000) -> tuple[np.ndarray, np.ndarray]:
-    filt = (ds.field(FAMILY_COL) == family) if family else None
-    cols = [COL_SM, COL_CR, COL_PH, LABEL_COL]
-    sc = dataset.scanner(columns=cols, filter=filt, batch_size=batch_size, use_threads=True)
-
-    xs, ys = [], []
-    for b in sc.to_batches():
-        sm = b.column(0).to_numpy(zero_copy_only=False)
-        cr = b.column(1).to_numpy(zero_copy_only=False)
-        ph = b.column(2).to_numpy(zero_copy_only=False)
-        y  = b.column(3).to_numpy(zero_copy_only=False)
-
-        m = np.isfinite(sm) & np.isfinite(cr) & np.isfinite(ph) & np.isfinite(y)
-        if not np.any(m):
-            continue
-        sm = sm[m].astype(np.float32, copy=False)
-        cr = cr[m].astype(np.float32, copy=False)
-        ph = ph[m].astype(np.float32, copy=False)
-        y  = y[m].astype(np.int8,   copy=False)
-
-        b_sm = (sm >= TAU_SM).astype(np.int8, copy=False)
-        b_cr = (cr >= TAU_CR).astype(np.int8, copy=False)
-        b_ph = (ph >= TAU_PH).astype(np.int8, copy=False)
-
-        s = (W_SM * b_sm + W_CR * b_cr + W_PH * b_ph).astype(np.float32, copy=False)
-
-        ys.extend(map(int, y))
-        xs.extend(map(float, s))
-
-    return np.asarray(ys, np.int8), np.asarray(xs, np.float32)
+try:
+    import polars as pl
+    HAS_POLARS = True
+except Exception:
+    HAS_POLARS = False
+
+# the weighted-score scan is shared with train/final_threshold/find_threshold.py
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from weighted_score import (COL_CR, COL_PH, COL_SM, FAMILY_COL, LABEL_COL, SCORE_LUT,
+                            TAU_CR, TAU_PH, TAU_SM, W_CR, W_PH, W_SM, auc,
+                            roc_curve_discrete, scan_weighted_scores, set_arrow_thread_pools)
+
+
+def scan_weighted_scores_polars(data_dir: Path, family: str | None) -> tuple[np.ndarray, np.ndarray]:
+    # same pattern/filter as weighted_score_columns, run by the polars streaming engine
+    lf = pl.scan_parquet(str(data_dir / "**" / "*.parquet"), hive_partitioning=True,
+                         hive_schema={FAMILY_COL: pl.String})
+    if family:
+        lf = lf.filter(pl.col(FAMILY_COL) == family)
+    lf = lf.filter(pl.col(COL_SM).is_finite() & pl.col(COL_CR).is_finite()
+                   & pl.col(COL_PH).is_finite() & pl.col(LABEL_COL).is_not_null())
+    pattern = ((pl.col(COL_SM) >= TAU_SM).cast(pl.Int8) + 2 * (pl.col(COL_CR) >= TAU_CR).cast(pl.Int8)
+               + 4 * (pl.col(COL_PH) >= TAU_PH).cast(pl.Int8))
+    df = lf.select(pattern.cast(pl.Int8).alias("pattern"),
+                   pl.col(LABEL_COL).cast(pl.Int8).alias("label")).collect(engine="streaming")
+    return df["label"].to_numpy(), SCORE_LUT[df["pattern"].to_numpy()]
+
+
+def scan_cache_path(cache_dir: Path, data_dir: Path, family: str | None) -> Path:
+    # key: every Parquet file's path/size/mtime plus family and the score constants
+    files = []
+    for root, _, names in os.walk(data_dir):
+        for name in names:
+            if name.endswith(".parquet"):
+                st = os.stat(os.path.join(root, name))
+                files.append((os.path.relpath(os.path.join(root, name), data_dir), st.st_size, st.st_mtime_ns))
+    key = json.dumps({
+        "data_dir": str(data_dir.resolve()),
+        "files": sorted(files),
+        "family": family,
+        "tau": [TAU_SM, TAU_CR, TAU_PH],
+        "w": [W_SM, W_CR, W_PH],
+    })
+    # the prefix names the (data_dir, family) slot, so a rescan can evict its stale entries
+    slot = json.dumps({"data_dir": str(data_dir.resolve()), "family": family})
+    return cache_dir / (f"scores_{hashlib.sha256(slot.encode()).hexdigest()[:8]}_"
+                        f"{hashlib.sha256(key.encode()).hexdigest()[:16]}.npz")
+
+
+def default_cache_dir() -> Path:
+    # per-user cache outside the source tree
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "correlf" / "roc_scores"
+
+
+def _to_float(v) -> float:
+    try:
+        return float(v)
+    except Exception:
+        return math.nan
 
 
 def read_agg_csv(perf_csv: Path) -> tuple[np.ndarray, np.ndarray]:
-    fprs, tprs = [], []
-    with open(perf_csv, "r", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        for row in r:
-            if "fpr" in row and "tpr" in row:
-                try:
-                    fp = float(row["fpr"]); tp = float(row["tpr"])
-                except Exception:
-                    continue
-                if math.isfinite(fp) and math.isfinite(tp):
-                    fprs.append(fp); tprs.append(tp)
-    if not fprs:
+    cols = ["fpr", "tpr"]
+    # short rows are skipped, as float(None) made DictReader rows unusable
+    popts = pacsv.ParseOptions(invalid_row_handler=lambda row: "skip")
+    try:
+        t = pacsv.read_csv(perf_csv, parse_options=popts, convert_options=pacsv.ConvertOptions(
+            include_columns=cols, include_missing_columns=True,
+            column_types={c: pa.float64() for c in cols}))
+        fprs, tprs = (t.column(c).to_numpy().astype(float) for c in cols)
+    except pa.ArrowInvalid:
+        # unparsable cells: read as text and drop them like float() would
+        t = pacsv.read_csv(perf_csv, parse_options=popts, convert_options=pacsv.ConvertOptions(
+            include_columns=cols, include_missing_columns=True,
+            column_types={c: pa.string() for c in cols}))
+        fprs, tprs = (np.fromiter(map(_to_float, t.column(c).to_pylist()), dtype=float, count=t.num_rows)
+                      for c in cols)
+
+    ok = np.isfinite(fprs) & np.isfinite(tprs)
+    fprs, tprs = fprs[ok], tprs[ok]
+    if not fprs.size:
         raise SystemExit(f"No usable rows in CSV: {perf_csv}")
-    pairs = sorted(zip(fprs, tprs))
-    xs, ys = [], []
-    for fp, tp in pairs:
-        if xs and abs(fp - xs[-1]) < 1e-12:
-            ys[-1] = max(ys[-1], tp)
-        else:
-            xs.append(fp); ys.append(tp)
+
+    order = np.lexsort((tprs, fprs))
+    fprs, tprs = fprs[order], tprs[order]
+    # collapse (near-)equal FPRs to their best TPR
+    starts = np.flatnonzero(np.r_[True, np.diff(fprs) >= 1e-12])
+    xs = fprs[starts]
+    ys = np.maximum.reduceat(tprs, starts)
 
     if xs[0] > 0.0:
-        xs.insert(0, 0.0); ys.insert(0, 0.0)
+        xs = np.r_[0.0, xs]; ys = np.r_[0.0, ys]
     if xs[-1] < 1.0:
-        xs.append(1.0); ys.append(1.0)
-    return np.array(xs, float), np.array(ys, float)
+        xs = np.r_[xs, 1.0]; ys = np.r_[ys, 1.0]
+    return xs, ys
 
 
 def youden_from_curve(fpr: np.ndarray, tpr: np.ndarray) -> tuple[float,float,int]:
-    j = tpr - fpr
-    idx = int(np.argmax(j))
+    idx = int(np.argmax(tpr - fpr))
     return float(fpr[idx]), float(tpr[idx]), idx
 
 
 def plot_both(fpr_csv, tpr_csv, fpr_raw, tpr_raw, out_png: Path, style: str, dpi: int):
-    import matplotlib.pyplot as plt
-    from sklearn.metrics import auc
-
     plt.style.use(style)
     fig, ax = plt.subplots(figsize=(9, 6), dpi=dpi)
     ax.plot([0, 1], [0, 1], "--", lw=1.0, color="gray", label="Chance", zorder=1)
@@ -102,13 +122,8 @@ def plot_both(fpr_csv, tpr_csv, fpr_raw, tpr_raw, out_png: Path, style: str, dpi
     auc_csv = auc(fpr_csv, tpr_csv)
     auc_raw = auc(fpr_raw, tpr_raw)
 
-    def youden_from_curve(fpr, tpr):
-        j = tpr - fpr
-        i = int(np.argmax(j))
-        return float(fpr[i]), float(tpr[i])
-
-    jx_csv, jy_csv = youden_from_curve(fpr_csv, tpr_csv)
-    jx_raw, jy_raw = youden_from_curve(fpr_raw, tpr_raw)
+    jx_csv, jy_csv, _ = youden_from_curve(fpr_csv, tpr_csv)
+    jx_raw, jy_raw, _ = youden_from_curve(fpr_raw, tpr_raw)
 
     ax.plot(fpr_csv, tpr_csv, lw=2.2, alpha=0.95, color=color_csv,
             label=f"Test (AUC={auc_csv:.4f})", zorder=4)
@@ -137,16 +152,38 @@ def main():
     ap.add_argument("--data-dir", type=Path, required=True,
                     help="Parquet dataset (hive: src_family=...) with rep_* columns")
     ap.add_argument("--family", default=None, help="Optional src_family filter")
+    ap.add_argument("--engine", choices=["arrow", "polars"], default="arrow",
+                    help="Scan engine for the Parquet dataset (polars is optional)")
+    ap.add_argument("--cache-dir", type=Path, default=default_cache_dir(),
+                    help="Where scanned (label, score) arrays are cached for re-plots "
+                         "(default: $XDG_CACHE_HOME/correlf/roc_scores)")
+    ap.add_argument("--force-rescan", action="store_true", help="Ignore cached scores and rescan the dataset")
     ap.add_argument("--out-png", type=Path, default=Path("roc_compare_weighted.png"))
     ap.add_argument("--plot-style", default="seaborn-v0_8-whitegrid")
     ap.add_argument("--plot-dpi", type=int, default=140)
     args = ap.parse_args()
+    set_arrow_thread_pools()
 
     fpr_csv, tpr_csv = read_agg_csv(args.perf_csv)
 
-    dset = ds.dataset(str(args.data_dir), format="parquet", partitioning="hive")
-    y, x = scan_weighted_scores(dset, args.family)
-    fpr_raw, tpr_raw, thr = roc_curve(y, x)
+    cache = scan_cache_path(args.cache_dir, args.data_dir, args.family)
+    if cache.exists() and not args.force_rescan:
+        with np.load(cache) as z:
+            y, x = z["y"], z["x"]
+        print(f"[INFO] Using cached scores: {cache}")
+    else:
+        if args.engine == "polars":
+            if not HAS_POLARS:
+                raise SystemExit("--engine polars needs the polars package")
+            y, x = scan_weighted_scores_polars(args.data_dir, args.family)
+        else:
+            dset = ds.dataset(str(args.data_dir), format="parquet", partitioning="hive")
+            y, x = scan_weighted_scores(dset, args.family)
+        args.cache_dir.mkdir(parents=True, exist_ok=True)
+        for stale in args.cache_dir.glob(cache.name.rsplit("_", 1)[0] + "_*.npz"):
+            stale.unlink(missing_ok=True)
+        np.savez_compressed(cache, y=y, x=x)
+    fpr_raw, tpr_raw, thr = roc_curve_discrete(y, x)
     m = ~np.isinf(thr)
     fpr_raw, tpr_raw = fpr_raw[m], tpr_raw[m]
 
@@ -1,102 +1,34 @@
 import argparse
 import csv
 import math
+import sys
 from pathlib import Path
 
 import numpy as np
 import pyarrow.dataset as ds
-from sklearn.metrics import roc_curve, auc
+import matplotlib
+matplotlib.use("Agg")  # batch PNG export, no GUI backend
 import matplotlib.pyplot as plt
 
-FAMILY_COL = "src_family"
-LABEL_COL  = "label_same_family"
-COL_SM     = "rep_string_minhash"
-COL_CR     = "rep_code_regions"
-COL_PH     = "rep_program_header"
-
-TAU_SM = 0.146484375
-TAU_CR = 0.3988839387893677
-TAU_PH = 0.8291192054748535
-
-W_SM = 0.6170
-W_PH = 0.0884
-W_CR = 0.2946
+# the weighted-score scan is shared with test/plot/plot_roc.py
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from weighted_score import (TAU_CR, TAU_PH, TAU_SM, W_CR, W_PH, W_SM, auc,
+                            metrics_from_roc, roc_curve_discrete, scan_weighted_scores,
+                            set_arrow_thread_pools)
 
 RECALL_TARGETS = [0.95, 0.99]
 
 
-def scan_weighted_scores(dataset: ds.Dataset,
-                         family: str | None,
-                         neg_pos_ratio: float,
-                         max_rows: int | None,
-                         batch_size: int = 128_000) -> tuple[np.ndarray, np.ndarray]:
-    filt = (ds.field(FAMILY_COL) == family) if family else None
-    cols = [COL_SM, COL_CR, COL_PH, LABEL_COL]
-    scanner = dataset.scanner(columns=cols, filter=filt, batch_size=batch_size, use_threads=True)
-
-    xs, ys = [], []
-    pos = neg = 0
-    for b in scanner.to_batches():
-        sm = b.column(0).to_numpy(zero_copy_only=False)
-        cr = b.column(1).to_numpy(zero_copy_only=False)
-        ph = b.column(2).to_numpy(zero_copy_only=False)
-        y  = b.column(3).to_numpy(zero_copy_only=False)
-
-        m = np.isfinite(sm) & np.isfinite(cr) & np.isfinite(ph) & np.isfinite(y)
-        if not np.any(m):
-            continue
-
-        sm = sm[m].astype(np.float32, copy=False)
-        cr = cr[m].astype(np.float32, copy=False)
-        ph = ph[m].astype(np.float32, copy=False)
-        y  = y[m].astype(np.int8,   copy=False)
-
-        b_sm = (sm >= TAU_SM).astype(np.int8, copy=False)
-        b_cr = (cr >= TAU_CR).astype(np.int8, copy=False)
-        b_ph = (ph >= TAU_PH).astype(np.int8, copy=False)
-
-        s = (W_SM * b_sm + W_CR * b_cr + W_PH * b_ph).astype(np.float32, copy=False)
-
-        if neg_pos_ratio > 0:
-            for si, yi in zip(s, y):
-                if yi == 1:
-                    ys.append(1); xs.append(float(si)); pos += 1
-                else:
-                    keep = neg < pos * neg_pos_ratio
-                    if keep:
-                        ys.append(0); xs.append(float(si)); neg += 1
-        else:
-            ys.extend(map(int, y))
-            xs.extend(map(float, s))
-
-        if max_rows and len(ys) >= max_rows:
-            break
-
-    return np.asarray(ys, np.int8), np.asarray(xs, np.float32)
-
-def metrics_at_threshold(y: np.ndarray, x: np.ndarray, thr: float) -> dict:
-    pred = x >= thr
-    tp = int(((pred == 1) & (y == 1)).sum())
-    fp = int(((pred == 1) & (y == 0)).sum())
-    tn = int(((pred == 0) & (y == 0)).sum())
-    fn = int(((pred == 0) & (y == 1)).sum())
-    pos = tp + fn; neg = tn + fp
-    tpr = tp / pos if pos else 0.0
-    fpr = fp / neg if neg else 0.0
-    prec = tp / (tp + fp) if (tp + fp) else 0.0
-    return dict(threshold=float(thr), tp=tp, fp=fp, tn=tn, fn=fn,
-                tpr=tpr, fpr=fpr, precision=prec)
-
-
 def pick_thresholds(y: np.ndarray, x: np.ndarray):
-    fpr, tpr, thr = roc_curve(y, x)
+    fpr, tpr, thr = roc_curve_discrete(y, x)
     m = ~np.isinf(thr)
     fpr, tpr, thr = fpr[m], tpr[m], thr[m]
+    pos = int(np.count_nonzero(y == 1)); neg = len(y) - pos
 
     # Youden's J
     j = tpr - fpr
     j_idx = int(np.argmax(j))
-    best_j = metrics_at_threshold(y, x, float(thr[j_idx]))
+    best_j = metrics_from_roc(fpr, tpr, thr, j_idx, pos, neg)
     best_j["criterion"] = "youdenJ"
 
     rec_thrs = []
@@ -108,7 +40,7 @@ def pick_thresholds(y: np.ndarray, x: np.ndarray):
                                  tpr=float("nan"), fpr=float("nan"), precision=float("nan")))
             continue
         sub = idx[np.argmin(fpr[idx])]
-        mtr = metrics_at_threshold(y, x, float(thr[sub]))
+        mtr = metrics_from_roc(fpr, tpr, thr, int(sub), pos, neg)
         mtr["criterion"] = f"recall>={target}"
         rec_thrs.append(mtr)
     return (fpr, tpr, thr), best_j, rec_thrs
@@ -135,12 +67,13 @@ def main():
     ap.add_argument("--family", default=None, help="Optional src_family filter")
     ap.add_argument("--neg-pos-ratio", type=float, default=0.0, help="Negatives per positive (0 = keep all)")
     ap.add_argument("--max-rows", type=int, default=0, help="Row cap (0 = no limit)")
-    ap.add_argument("--batch-size", type=int, default=128_000)
+    ap.add_argument("--batch-size", type=int, default=16_384)
     ap.add_argument("--out-csv", type=Path, default=Path("roc_final_weighted_summary.csv"))
     ap.add_argument("--out-plot", type=Path, default=Path("roc_final_weighted.png"))
     ap.add_argument("--plot-style", default="seaborn-v0_8-whitegrid")
     ap.add_argument("--plot-dpi", type=int, default=140)
     args = ap.parse_args()
+    set_arrow_thread_pools()
 
     dset = ds.dataset(str(args.data_dir), format="parquet", partitioning="hive")
 
@@ -1,10 +1,17 @@
-import argparse, math
+import argparse, math, sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import numpy as np
+import pyarrow.compute as pc
 import pyarrow.dataset as ds
-from sklearn.metrics import roc_curve, auc
+import matplotlib
+matplotlib.use("Agg")  # batch PNG export, no GUI backend
 import matplotlib.pyplot as plt
 
+# negative subsampling and the ROC helpers are shared with the weighted-score scripts
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from weighted_score import auc, metrics_from_roc, roc_from_counts, subsample_negatives
+
 REPS = {
     "rep_string_minhash":    "String-MinHash",
     "rep_code_regions":      "Code-Regionen-Liste",
@@ -21,55 +28,69 @@ def scan(dataset: ds.Dataset,
          family: str | None,
          neg_pos_ratio: float,
          max_rows: int | None,
-         seed: int) -> tuple[np.ndarray, np.ndarray]:
-    import random
-    rng = random.Random(seed)
-    filt = (ds.field(FAMILY_COL) == family) if family else None
-    scanner = dataset.scanner(columns=[rep_col, LABEL_COL], filter=filt, batch_size=64_000, use_threads=True)
-
-    xs, ys = [], []
-    pos = neg = 0
+         seed: int,
+         batch_size: int = 262_144) -> tuple[np.ndarray, np.ndarray]:
+    fam_filt = (ds.field(FAMILY_COL) == family) if family else None
+    # NaN scores and null labels are dropped by the scanner, so batches arrive trimmed
+    filt = ~pc.is_nan(ds.field(rep_col)) & ds.field(LABEL_COL).is_valid()
+    if fam_filt is not None:
+        filt = filt & fam_filt
+    # two narrow columns: large batches amortize the per-batch Python work, and a short
+    # readahead keeps the number of decoded batches held in memory bounded
+    scanner = dataset.scanner(columns=[rep_col, LABEL_COL], filter=filt, batch_size=batch_size, use_threads=True,
+                              batch_readahead=2, fragment_readahead=2)
+
+    # upper bound from Parquet metadata (the family is a partition key); with a row cap the
+    # loop stops within one batch of max_rows, so no more than max_rows + batch_size is needed
+    cap = dataset.count_rows(filter=fam_filt)
+    if max_rows:
+        cap = min(cap, max_rows + batch_size)
+    xs = np.empty(cap, np.float32)
+    ys = np.empty(cap, np.int8)
+
+    pos = neg = n = 0
     for b in scanner.to_batches():
         x = b.column(0).to_numpy(zero_copy_only=False)
         y = b.column(1).to_numpy(zero_copy_only=False)
-        m = ~np.isnan(x)
-        x, y = x[m], y[m]
-
-        for s, yy in zip(x, y):
-            if yy == 1:
-                ys.append(1); xs.append(float(s)); pos += 1
-            else:
-                keep = (neg_pos_ratio <= 0) or (neg < pos * neg_pos_ratio)
-                if keep:
-                    ys.append(0); xs.append(float(s)); neg += 1
-
-        if max_rows and len(ys) >= max_rows:
+
+        if neg_pos_ratio > 0:
+            keep, pos, neg = subsample_negatives(y, pos, neg, neg_pos_ratio)
+            x, y = x[keep], y[keep]
+
+        k = min(len(y), cap - n)
+        x, y = x[:k], y[:k]
+        xs[n:n + k] = x
+        ys[n:n + k] = y == 1
+        n += k
+
+        if max_rows and n >= max_rows:
             break
 
-    return np.asarray(ys, np.int8), np.asarray(xs, np.float32)
+    return ys[:n], xs[:n]
 
 
-def metrics_at_threshold(y: np.ndarray, x: np.ndarray, thr: float) -> dict:
-    pred = x >= thr
-    tp = int(((pred == 1) & (y == 1)).sum())
-    fp = int(((pred == 1) & (y == 0)).sum())
-    tn = int(((pred == 0) & (y == 0)).sum())
-    fn = int(((pred == 0) & (y == 1)).sum())
-    pos = tp + fn; neg = tn + fp
-    tpr = tp / pos if pos else 0.0
-    fpr = fp / neg if neg else 0.0
-    prec = tp / (tp + fp) if (tp + fp) else 0.0
-    return dict(threshold=float(thr), tp=tp, fp=fp, tn=tn, fn=fn, tpr=tpr, fpr=fpr, precision=prec)
+def roc_curve_sorted(y: np.ndarray, x: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """sklearn's roc_curve(y, x) from one stable argsort and a cumsum: counts at every
+    distinct score, then the same drop_intermediate rule and (0, 0)/inf start point."""
+    order = np.argsort(x, kind="mergesort")[::-1]
+    xs = x[order]
+    tps_all = np.cumsum(y[order] == 1, dtype=np.int64)
+    idx = np.r_[np.flatnonzero(np.diff(xs)), xs.size - 1]
+    tps = tps_all[idx].astype(np.float64)
+    fps = (idx + 1 - tps_all[idx]).astype(np.float64)
+    thr = xs[idx].astype(np.float64)
+    return roc_from_counts(fps, tps, thr)
 
 
 def pick_thresholds(y: np.ndarray, x: np.ndarray):
-    fpr, tpr, thr = roc_curve(y, x)
+    fpr, tpr, thr = roc_curve_sorted(y, x)
     m = ~np.isinf(thr)
     fpr, tpr, thr = fpr[m], tpr[m], thr[m]
+    pos = int(np.count_nonzero(y == 1)); neg = len(y) - pos
 
     j = tpr - fpr
     j_idx = int(np.argmax(j))
-    best_j = metrics_at_threshold(y, x, float(thr[j_idx]))
+    best_j = metrics_from_roc(fpr, tpr, thr, j_idx, pos, neg)
     best_j["criterion"] = "youdenJ"
     best_j["youden_recall"] = best_j["tpr"]
 
@@ -82,7 +103,7 @@ def pick_thresholds(y: np.ndarray, x: np.ndarray):
                                  fpr=float("nan"), precision=float("nan")))
             continue
         sub = idx[np.argmin(fpr[idx])]
-        mtr = metrics_at_threshold(y, x, float(thr[sub]))
+        mtr = metrics_from_roc(fpr, tpr, thr, int(sub), pos, neg)
         mtr["criterion"] = f"recall>={target}"
         rec_thrs.append(mtr)
 
@@ -108,6 +129,44 @@ def plot_rocs(curves, out_png, style, dpi):
 
 
 
+def eval_rep(col: str, name: str, args: argparse.Namespace, max_rows: int | None):
+    dset = ds.dataset(str(args.data_dir), format="parquet", partitioning="hive")
+    log = [f"[INFO] {name} …"]
+    y, x = scan(dset, col, args.family, args.neg_pos_ratio, max_rows, args.seed, args.batch_size)
+    n_pos, n_neg = int((y == 1).sum()), int((y == 0).sum())
+    log.append(f"  sample: n={len(y)} pos={n_pos} neg={n_neg}")
+
+    (fpr, tpr, thr), best_j, recs = pick_thresholds(y, x)
+    A = auc(fpr, tpr)
+    log.append(f"  AUC={A:.6f}  YoudenJ thr={best_j['threshold']:.6g} "
+               f"(TPR={best_j['tpr']:.3f}, FPR={best_j['fpr']:.3f}, P={best_j['precision']:.3f}) "
+               f"recall@J={best_j['youden_recall']:.3f}")
+
+    for r in recs:
+        if isinstance(r["tpr"], float) and math.isnan(r["tpr"]):
+            log.append(f"  {r['criterion']}: not reachable")
+        else:
+            log.append(f"  {r['criterion']}: thr={r['threshold']:.6g} "
+                       f"(TPR={r['tpr']:.3f}, FPR={r['fpr']:.3f}, P={r['precision']:.3f})")
+
+    row = {
+        "representation": name,
+        "auc": A,
+        "youden_thr": best_j["threshold"],
+        "youden_tpr": best_j["tpr"],
+        "youden_fpr": best_j["fpr"],
+        "youden_prec": best_j["precision"],
+        "youden_recall": best_j["youden_recall"],
+        **{f"rec{int(t*100)}_thr": recs[i]["threshold"] for i, t in enumerate(RECALL_TARGETS)},
+        **{f"rec{int(t*100)}_tpr": recs[i]["tpr"] for i, t in enumerate(RECALL_TARGETS)},
+        **{f"rec{int(t*100)}_fpr": recs[i]["fpr"] for i, t in enumerate(RECALL_TARGETS)},
+        **{f"rec{int(t*100)}_prec": recs[i]["precision"] for i, t in enumerate(RECALL_TARGETS)},
+        "sample_pos": n_pos,
+        "sample_neg": n_neg,
+    }
+    return row, (fpr, tpr, A, best_j), log
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--data-dir", required=True, type=Path)
@@ -116,6 +175,8 @@ def main():
     ap.add_argument("--max-rows", type=int, default=1_500_000, help="Approx upper bound on rows (0 = no limit)")
     ap.add_argument("--full", action="store_true", help="Use entire dataset (sets --neg-pos-ratio 0 and --max-rows 0)")
     ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--batch-size", type=int, default=262_144, help="Scanner batch size")
+    ap.add_argument("--workers", type=int, default=len(REPS), help="Representations evaluated in parallel")
     ap.add_argument("--out-csv", type=Path, default=Path("roc_thresholds_summary.csv"))
     ap.add_argument("--out-plot", type=Path, default=Path("roc_curves.png"))
     ap.add_argument("--plot-style", default="seaborn-v0_8-whitegrid")
@@ -128,47 +189,18 @@ def main():
 
     max_rows = None if not args.max_rows or args.max_rows <= 0 else args.max_rows
 
-    dset = ds.dataset(str(args.data_dir), format="parquet", partitioning="hive")
-
     rows = []
     curves = {}
 
-    for col, name in REPS.items():
-        print(f"[INFO] {name} …")
-        y, x = scan(dset, col, args.family, args.neg_pos_ratio, max_rows, args.seed)
-        n_pos, n_neg = int((y == 1).sum()), int((y == 0).sum())
-        print(f"  sample: n={len(y)} pos={n_pos} neg={n_neg}")
-
-        (fpr, tpr, thr), best_j, recs = pick_thresholds(y, x)
-        A = auc(fpr, tpr)
-        print(f"  AUC={A:.6f}  YoudenJ thr={best_j['threshold']:.6g} "
-              f"(TPR={best_j['tpr']:.3f}, FPR={best_j['fpr']:.3f}, P={best_j['precision']:.3f}) "
-              f"recall@J={best_j['youden_recall']:.3f}")
-
-        for r in recs:
-            if isinstance(r["tpr"], float) and math.isnan(r["tpr"]):
-                print(f"  {r['criterion']}: not reachable")
-            else:
-                print(f"  {r['criterion']}: thr={r['threshold']:.6g} "
-                      f"(TPR={r['tpr']:.3f}, FPR={r['fpr']:.3f}, P={r['precision']:.3f})")
-
-        rows.append({
-            "representation": name,
-            "auc": A,
-            "youden_thr": best_j["threshold"],
-            "youden_tpr": best_j["tpr"],
-            "youden_fpr": best_j["fpr"],
-            "youden_prec": best_j["precision"],
-            "youden_recall": best_j["youden_recall"],
-            **{f"rec{int(t*100)}_thr": recs[i]["threshold"] for i, t in enumerate(RECALL_TARGETS)},
-            **{f"rec{int(t*100)}_tpr": recs[i]["tpr"] for i, t in enumerate(RECALL_TARGETS)},
-            **{f"rec{int(t*100)}_fpr": recs[i]["fpr"] for i, t in enumerate(RECALL_TARGETS)},
-            **{f"rec{int(t*100)}_prec": recs[i]["precision"] for i, t in enumerate(RECALL_TARGETS)},
-            "sample_pos": n_pos,
-            "sample_neg": n_neg,
-        })
-
-        curves[name] = (fpr, tpr, A, best_j)
+    # each representation is an independent scan + sort + ROC; workers return their
+    # log lines so the output stays grouped per representation, in REPS order
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(REPS)))) as ex:
+        futures = [ex.submit(eval_rep, col, name, args, max_rows) for col, name in REPS.items()]
+        for name, fut in zip(REPS.values(), futures):
+            row, curve, log = fut.result()
+            print("\n".join(log))
+            rows.append(row)
+            curves[name] = curve
 
     import csv
     keys = list(rows[0].keys()) if rows else []
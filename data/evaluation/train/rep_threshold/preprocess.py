@@ -8,7 +8,7 @@ Output: partitioned Parquet dataset (partitioned by src_family), one row per (sr
 Schema (columns):
 - src_file, tgt_file (str)
 - src_family, tgt_family (str, derived from name before '___')
-- rep_string_minhash, rep_code_regions, rep_program_header, rep_elf_header, rep_section_sizes (float32)
+- rep_string_minhash, rep_code_regions, rep_program_header, rep_elf_header, rep_section_sizes (float32, NaN if missing)
 - label_same_family (int8)
 
 Dedup rule (no global state needed):
@@ -22,8 +22,16 @@ import json
 import os
 import sys
 import uuid
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Dict, Iterable, Iterator, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except Exception:
+    HAS_ORJSON = False
 
 try:
     import ijson
@@ -31,7 +39,9 @@ try:
 except Exception:
     HAS_IJSON = False
 
+import numpy as np
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.dataset as ds
 
 # ---------- Config ----------
@@ -45,16 +55,16 @@ REPS_MAP = {
 }
 
 SCHEMA = pa.schema([
-    pa.field("src_file", pa.string()),
-    pa.field("tgt_file", pa.string()),
-    pa.field("src_family", pa.string()),
-    pa.field("tgt_family", pa.string()),
-    pa.field("rep_string_minhash", pa.float32()),
-    pa.field("rep_code_regions", pa.float32()),
-    pa.field("rep_program_header", pa.float32()),
-    pa.field("rep_elf_header", pa.float32()),
-    pa.field("rep_section_sizes", pa.float32()),
-    pa.field("label_same_family", pa.int8()),
+    pa.field("src_file", pa.string(), nullable=False),
+    pa.field("tgt_file", pa.string(), nullable=False),
+    pa.field("src_family", pa.string(), nullable=False),
+    pa.field("tgt_family", pa.string(), nullable=False),
+    pa.field("rep_string_minhash", pa.float32(), nullable=False),
+    pa.field("rep_code_regions", pa.float32(), nullable=False),
+    pa.field("rep_program_header", pa.float32(), nullable=False),
+    pa.field("rep_elf_header", pa.float32(), nullable=False),
+    pa.field("rep_section_sizes", pa.float32(), nullable=False),
+    pa.field("label_same_family", pa.int8(), nullable=False),
 ])
 
 
@@ -66,8 +76,16 @@ def open_text(path: Path) -> io.TextIOBase:
         return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8")
     return open(path, "r", encoding="utf-8")
 
+def read_bytes(path: Path) -> bytes:
+    if is_gzip(path):
+        with gzip.open(path, "rb") as f:
+            return f.read()
+    return path.read_bytes()
+
+# every row of a file repeats the anchor, and DB targets recur across files
+@lru_cache(maxsize=None)
 def family_from_name(name: str) -> str:
-    return name.split("___", 1)[0].lower()
+    return name.partition("___")[0].lower()
 
 def iter_filecomparisons(path: Path) -> Iterator[Dict]:
     try:
@@ -86,33 +104,65 @@ def iter_filecomparisons(path: Path) -> Iterator[Dict]:
     except Exception as e:
         print(f"[WARN] Failed to parse {path.name}: {e}", file=sys.stderr)
 
-def to_row(obj: Dict) -> Optional[Dict]:
-    tgt = obj.get("fileName")           # DB/target
-    src = obj.get("secondFileName")     # input/source
-    if not src or not tgt:
-        return None
-    if src == tgt:
-        return None
-    if src > tgt:
+def load_filecomparisons(path: Path, low_memory: bool = False) -> List[Dict]:
+    if low_memory:
+        return list(iter_filecomparisons(path))
+    try:
+        raw = read_bytes(path)
+        if HAS_ORJSON:
+            try:
+                data = orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                data = json.loads(raw)  # bare NaN tokens are only accepted by the stdlib parser
+        else:
+            data = json.loads(raw)
+    except Exception:
+        # truncated/corrupt file: stream it to keep the objects before the error
+        return list(iter_filecomparisons(path))
+    if not isinstance(data, list):
+        return []
+    return [obj for obj in data if isinstance(obj, dict)]
+
+def to_batch(objs: List[Dict]) -> Optional[pa.RecordBatch]:
+    """Columnize one file's comparisons (rows with src_file < tgt_file)."""
+    tgts = [obj.get("fileName") for obj in objs]           # DB/target
+    srcs = [obj.get("secondFileName") for obj in objs]     # input/source
+    keep = [i for i, (src, tgt) in enumerate(zip(srcs, tgts)) if src and tgt and src < tgt]
+    if not keep:
         return None
 
-    src_fam = family_from_name(src)
-    tgt_fam = family_from_name(tgt)
+    src = [srcs[i] for i in keep]
+    tgt = [tgts[i] for i in keep]
+    dets = [objs[i].get("comparisonDetails") or {} for i in keep]
+    src_fam = pa.array([family_from_name(s) for s in src], type=pa.string())
+    tgt_fam = pa.array([family_from_name(t) for t in tgt], type=pa.string())
 
-    det = obj.get("comparisonDetails") or {}
-    row = {
-        "src_file": src,
-        "tgt_file": tgt,
+    # every column is built as a typed Arrow array; the label is one kernel call
+    cols = {
+        "src_file": pa.array(src, type=pa.string()),
+        "tgt_file": pa.array(tgt, type=pa.string()),
         "src_family": src_fam,
         "tgt_family": tgt_fam,
-        "rep_string_minhash": _to_f32(det.get("STRING_MINHASH")),
-        "rep_code_regions": _to_f32(det.get("CODE_REGION_LIST")),
-        "rep_program_header": _to_f32(det.get("PROGRAM_HEADER_VECTOR")),
-        "rep_elf_header": _to_f32(det.get("ELF_HEADER_VECTOR")),
-        "rep_section_sizes": _to_f32(det.get("SECTION_SIZE_VECTOR")),
-        "label_same_family": 1 if src_fam == tgt_fam else 0,
+        "label_same_family": pc.equal(src_fam, tgt_fam).cast(pa.int8()),
     }
-    return row
+    for key, col in REPS_MAP.items():
+        cols[col] = f32_array([d.get(key) for d in dets])
+
+    return pa.record_batch([cols[f.name] for f in SCHEMA], schema=SCHEMA)
+
+def f32_array(vals: List) -> pa.Array:
+    # bulk conversion straight into a float32 buffer (None -> NaN), which Arrow wraps
+    # without a copy or cast; missing/unparsable values become NaN rather than nulls,
+    # so readers get the column without a validity bitmap (zero-copy to_numpy).
+    # The per-value fallback only runs for files with non-numeric score fields.
+    try:
+        arr = np.array(vals, dtype=np.float32)
+        bulk = arr.ndim == 1
+    except (TypeError, ValueError, OverflowError):
+        bulk = False
+    if not bulk:
+        arr = np.array([_to_f32(v) for v in vals], dtype=np.float32)
+    return pa.array(arr, type=pa.float32())
 
 def _to_f32(v) -> Optional[float]:
     try:
@@ -122,23 +172,17 @@ def _to_f32(v) -> Optional[float]:
     except Exception:
         return None
 
-def write_chunk_arrow(rows: List[Dict], base_dir: Path) -> None:
-    if not rows:
-        return
-
-    arrays = {name: [] for name in SCHEMA.names}
-    for r in rows:
-        for k in arrays:
-            arrays[k].append(r.get(k))
-    table = pa.table(arrays, schema=SCHEMA)
-
+def write_dataset_arrow(batches: Iterator[pa.RecordBatch], base_dir: Path) -> None:
     # Parquet-Write-Options korrekt erzeugen (keine pa.parquet.* Nutzung!)
     fmt = ds.ParquetFileFormat()
     opts = fmt.make_write_options(compression="snappy")
 
+    # one writer for the whole run: partition files stay open across chunks
+    # instead of being reopened (and part-0 overwritten) per flush
     ds.write_dataset(
-        table,
+        batches,
         base_dir=str(base_dir),
+        schema=SCHEMA,
         format=fmt,
         partitioning=ds.partitioning(
             pa.schema([pa.field("src_family", pa.string())]),
@@ -151,49 +195,64 @@ def write_chunk_arrow(rows: List[Dict], base_dir: Path) -> None:
         use_threads=True,
     )
 
-def preprocess(input_dir: Path, output_dir: Path, chunk_rows: int = 500_000) -> None:
+def read_one(path: Path, low_memory: bool = False) -> Tuple[int, Optional[pa.RecordBatch]]:
+    objs = load_filecomparisons(path, low_memory)
+    return len(objs), (to_batch(objs) if objs else None)
+
+def iter_chunks(json_files: List[Path], chunk_rows: int, stats: Dict[str, int],
+                workers: Optional[int] = None, low_memory: bool = False) -> Iterator[pa.RecordBatch]:
+    buffer: List[pa.RecordBatch] = []
+    buffered = 0
+
+    # files are parsed and columnized in worker processes; map() keeps input order
+    read = partial(read_one, low_memory=low_memory)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as ex:
+        for path, (n_objs, batch) in zip(json_files, ex.map(read, json_files, chunksize=8)):
+            stats["total_rows"] += n_objs
+            n_kept = batch.num_rows if batch is not None else 0
+            if batch is not None:
+                buffer.append(batch)
+                buffered += n_kept
+                stats["kept_rows"] += n_kept
+                if buffered >= chunk_rows:
+                    yield concat_batches(buffer)
+                    buffer.clear()
+                    buffered = 0
+            if n_objs:
+                stats["files_ok"] += 1
+            else:
+                stats["files_bad"] += 1
+            print(f"[{stats['files_ok']+stats['files_bad']:6d}/{len(json_files):6d}] {path.name} → kept {n_kept:6d} rows")
+
+    if buffer:
+        yield concat_batches(buffer)
+
+def concat_batches(batches: List[pa.RecordBatch]) -> pa.RecordBatch:
+    # one contiguous chunk per column, so row groups are not split per source file
+    return pa.Table.from_batches(batches, schema=SCHEMA).combine_chunks().to_batches()[0]
+
+def preprocess(input_dir: Path, output_dir: Path, chunk_rows: int = 500_000,
+               workers: Optional[int] = None, low_memory: bool = False) -> None:
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    json_files = sorted([p for p in input_dir.iterdir() if p.is_file() and p.suffix.lower() in (".json", ".gz", ".gzip")])
+    # DirEntry.is_file() uses the type from the directory listing, no stat per file
+    with os.scandir(input_dir) as it:
+        json_files = sorted(Path(e.path) for e in it
+                            if e.is_file() and os.path.splitext(e.name)[1].lower() in (".json", ".gz", ".gzip"))
     if not json_files:
         print(f"[ERROR] No JSON(.gz) files in {input_dir}", file=sys.stderr)
         sys.exit(2)
 
-    buffer: List[Dict] = []
-    total_rows = 0
-    kept_rows = 0
-    files_ok = files_bad = 0
-
-    for path in json_files:
-        n_before = kept_rows
-        parsed_any = False
-        for obj in iter_filecomparisons(path):
-            parsed_any = True
-            row = to_row(obj)
-            total_rows += 1
-            if row is None:
-                continue
-            buffer.append(row)
-            kept_rows += 1
-            if len(buffer) >= chunk_rows:
-                write_chunk_arrow(buffer, output_dir)
-                buffer.clear()
-        if parsed_any:
-            files_ok += 1
-        else:
-            files_bad += 1
-        print(f"[{files_ok+files_bad:6d}/{len(json_files):6d}] {path.name} → kept {kept_rows-n_before:6d} rows")
-
-    write_chunk_arrow(buffer, output_dir)
-    buffer.clear()
+    stats = {"total_rows": 0, "kept_rows": 0, "files_ok": 0, "files_bad": 0}
+    write_dataset_arrow(iter_chunks(json_files, chunk_rows, stats, workers, low_memory), output_dir)
 
     meta = {
         "input_dir": str(input_dir),
         "output_dir": str(output_dir),
-        "files_ok": files_ok,
-        "files_bad": files_bad,
-        "total_pairs_seen": total_rows,
-        "total_pairs_kept": kept_rows,
+        "files_ok": stats["files_ok"],
+        "files_bad": stats["files_bad"],
+        "total_pairs_seen": stats["total_rows"],
+        "total_pairs_kept": stats["kept_rows"],
         "dedupe_rule": "keep only src_file < tgt_file; drop src==tgt",
         "partitions": ["src_family"],
         "schema": [f"{f.name}:{f.type}" for f in SCHEMA],
@@ -208,8 +267,11 @@ def parse_args() -> argparse.Namespace:
     ap.add_argument("--input-dir", type=Path, required=True, help="Directory with JSON files")
     ap.add_argument("--output-dir", type=Path, required=True, help="Output directory for Parquet dataset")
     ap.add_argument("--chunk-rows", type=int, default=500_000, help="Rows per write chunk (default: 500k)")
+    ap.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    ap.add_argument("--low-memory", action="store_true",
+                    help="Stream each JSON file with ijson instead of parsing it whole")
     return ap.parse_args()
 
 if __name__ == "__main__":
     args = parse_args()
-    preprocess(args.input_dir, args.output_dir, args.chunk_rows)
+    preprocess(args.input_dir, args.output_dir, args.chunk_rows, args.workers, args.low_memory)
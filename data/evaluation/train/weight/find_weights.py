@@ -1,13 +1,19 @@
 import argparse
 import json
+import sys
 from pathlib import Path
 from typing import Optional, List, Tuple
 
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.dataset as ds
-from sklearn.linear_model import LogisticRegression
 from tqdm import tqdm
 
+# Arrow pool sizing is shared with the weighted-score scans
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from weighted_score import set_arrow_thread_pools
+
 PARTITION_COL = "src_family"
 LABEL_COL     = "label_same_family"
 
@@ -27,52 +33,45 @@ def _bits_from_pattern(p: int) -> np.ndarray:
 
 def aggregate_counts(in_dir: Path,
                      families: Optional[List[str]] = None,
-                     batch_size: int = 256_000) -> Tuple[np.ndarray, int, int]:
+                     batch_size: int = 262_144) -> Tuple[np.ndarray, int, int]:
+
+    # the whole 4-bit code (label << 3 | ph << 2 | cr << 1 | sm) is built in the scanner
+    # projection; a null in any input makes the code null and the filter drops the row
+    def bit(col, shift):
+        return pc.shift_left(ds.field(col).cast(pa.int8()), shift)
+
+    code = pc.bit_wise_or(
+        pc.bit_wise_or(bit(LABEL_COL, 3), bit(BIN_COLS["PROGRAM_HEADER_VECTOR"], 2)),
+        pc.bit_wise_or(bit(BIN_COLS["CODE_REGION_LIST"], 1), bit(BIN_COLS["STRING_MINHASH"], 0)),
+    )
 
-    cols = [PARTITION_COL, LABEL_COL,
-            BIN_COLS["STRING_MINHASH"], BIN_COLS["CODE_REGION_LIST"], BIN_COLS["PROGRAM_HEADER_VECTOR"]]
     dset = ds.dataset(str(in_dir), format="parquet", partitioning="hive")
-    scanner = dset.scanner(columns=cols, batch_size=batch_size, use_threads=True)
+    # the family is the hive partition key: filtering in the scanner prunes whole
+    # partitions instead of comparing strings per row
+    fam_filt = ds.field(PARTITION_COL).isin(families) if families else None
+    filt = code.is_valid() if fam_filt is None else fam_filt & code.is_valid()
+    # as in the threshold scans, a short readahead bounds the decoded batches held in memory
+    scanner = dset.scanner(columns={"code": code}, filter=filt, batch_size=batch_size, use_threads=True,
+                           batch_readahead=2, fragment_readahead=2)
 
     counts = np.zeros((8, 2), dtype=np.int64)
-    total_seen = 0
+    # from Parquet metadata: every row of the dataset, as when the family filter ran per
+    # batch; the loop only sees the rows that survive the family and null filters
+    total_seen = dset.count_rows()
     total_kept = 0
 
-    pbar = tqdm(desc="Scanning & counting", unit="rows", leave=False)
+    pbar = tqdm(desc="Scanning & counting", total=dset.count_rows(filter=fam_filt), unit="rows", leave=False,
+                mininterval=0.5, smoothing=0)
     for b in scanner.to_batches():
         n = b.num_rows
-        total_seen += n
-        pbar.update(n)
-
-        fam = b.column(0).to_numpy(zero_copy_only=False).astype(str)
-        y   = b.column(1).to_numpy(zero_copy_only=False)
-
-        sm  = b.column(2).to_numpy(zero_copy_only=False)  # STRING_MINHASH (0/1)
-        cr  = b.column(3).to_numpy(zero_copy_only=False)  # CODE_REGION_LIST (0/1)
-        ph  = b.column(4).to_numpy(zero_copy_only=False)  # PROGRAM_HEADER_VECTOR (0/1)
-
-        # Valid mask
-        mask = np.isfinite(y) & np.isfinite(sm) & np.isfinite(cr) & np.isfinite(ph)
-        if families:
-            mask &= np.isin(fam, families)
-
-        if not np.any(mask):
+        if n == 0:
             continue
+        pbar.update(n)
 
-        y  = y[mask].astype(np.int8, copy=False)
-        sm = sm[mask].astype(np.int8, copy=False)
-        cr = cr[mask].astype(np.int8, copy=False)
-        ph = ph[mask].astype(np.int8, copy=False)
-
-        pat = ((ph << 2) | (cr << 1) | sm).astype(np.int8, copy=False)
-
-        for lbl in (0, 1):
-            sel = (y == lbl)
-            if np.any(sel):
-                hist = np.bincount(pat[sel], minlength=8)
-                counts[:len(hist), lbl] += hist
-
-        total_kept += int(mask.sum())
+        # one int8 column crosses into NumPy; bincount widens it itself
+        h = np.bincount(b.column(0).to_numpy(zero_copy_only=False), minlength=16).reshape(2, 8)
+        counts += h.T
+        total_kept += n
 
     pbar.close()
     return counts, total_seen, total_kept
@@ -107,22 +106,49 @@ def fit_weights_aggregated(X: np.ndarray,
                            w: np.ndarray,
                            max_iter: int = 400,
                            C: float = 1.0,
-                           random_state: int = 42) -> Tuple[np.ndarray, dict]:
-
-    clf = LogisticRegression(
-        solver="lbfgs",
-        penalty="l2",
-        C=C,
-        class_weight=None,
-        max_iter=max_iter,
-        random_state=random_state,
-        n_jobs=1,
-        verbose=0,
-    )
-    clf.fit(X, y, sample_weight=w)
-
-    coef = np.asarray(clf.coef_[0], dtype=np.float64)
-    coef = np.clip(coef, 0.0, None)
+                           tol: float = 1e-10) -> Tuple[np.ndarray, dict]:
+    """Weighted L2 logistic regression on the (at most 16) aggregated rows, the same
+    objective sklearn's LogisticRegression(C=C) minimizes, solved by damped Newton steps
+    on 3 coefficients + intercept:  C * sum_i w_i * logloss_i + 0.5 * ||coef||^2."""
+    classes = np.unique(y[w > 0])
+    if classes.size < 2:
+        # LogisticRegression.fit refuses this too; a fit on one class is not a model
+        raise ValueError(f"Aggregated counts contain only one class: {classes.tolist()}. "
+                         "Check input filters.")
+
+    A = np.hstack([X.astype(np.float64), np.ones((len(X), 1))])
+    t = y.astype(np.float64)
+    reg = np.r_[np.ones(X.shape[1]), 0.0]  # intercept is not penalized
+
+    def objective(beta):
+        z = A @ beta
+        return C * np.dot(w, np.logaddexp(0.0, z) - t * z) + 0.5 * np.dot(reg * beta, beta)
+
+    beta = np.zeros(A.shape[1])
+    f = objective(beta)
+    n_iter = 0
+    for n_iter in range(1, max_iter + 1):
+        p = 1.0 / (1.0 + np.exp(-(A @ beta)))
+        grad = C * (A.T @ (w * (p - t))) + reg * beta
+        hess = C * (A.T * (w * p * (1.0 - p))) @ A + np.diag(reg)
+        step = np.linalg.solve(hess, grad)
+        # halve the step until the objective decreases (Newton may overshoot far from the optimum)
+        alpha = 1.0
+        while alpha > 1e-8:
+            f_new = objective(beta - alpha * step)
+            if f_new <= f:
+                break
+            alpha *= 0.5
+        else:
+            # no step length decreases the objective: beta is optimal to rounding, keep it
+            break
+        beta = beta - alpha * step
+        if f - f_new <= tol * max(1.0, abs(f_new)):
+            f = f_new
+            break
+        f = f_new
+
+    coef = np.clip(beta[:-1], 0.0, None)
     s = coef.sum()
     if s <= 0:
         weights = np.ones_like(coef) / len(coef)
@@ -130,9 +156,9 @@ def fit_weights_aggregated(X: np.ndarray,
         weights = coef / s
 
     extras = {
-        "lr_classes_": list(map(int, clf.classes_)),
-        "lr_n_iter_": int(np.max(clf.n_iter_)) if np.ndim(clf.n_iter_) else int(clf.n_iter_),
-        "solver": "lbfgs",
+        "lr_classes_": [int(c) for c in classes],
+        "lr_n_iter_": int(n_iter),
+        "solver": "newton",
         "penalty": "l2",
         "C": float(C),
         "used_sample_weight": True,
@@ -146,22 +172,24 @@ def parse_args() -> argparse.Namespace:
     ap.add_argument("--out", required=True, type=Path, help="Output JSON model path")
     ap.add_argument("--families", nargs="*", default=None,
                     help="Optional list of src_family partitions to include (default: all)")
-    ap.add_argument("--batch-size", type=int, default=256_000, help="Parquet scan batch size")
+    ap.add_argument("--batch-size", type=int, default=262_144, help="Parquet scan batch size")
     ap.add_argument("--max-iter", type=int, default=400,
-                    help="Max iterations for LogisticRegression on aggregated data (200–500 typical)")
+                    help="Max Newton iterations for the logistic fit on aggregated data")
     ap.add_argument("--C", type=float, default=1.0, help="Inverse regularization strength")
-    ap.add_argument("--random-state", type=int, default=42, help="Random seed")
+    # accepted so existing invocations keep working; the Newton fit is deterministic
+    ap.add_argument("--random-state", type=int, default=42, help=argparse.SUPPRESS)
     return ap.parse_args()
 
 def main():
     args = parse_args()
+    set_arrow_thread_pools()
 
     counts, rows_seen, rows_kept = aggregate_counts(args.in_dir, args.families, args.batch_size)
 
     X_small, y_small, w_small = build_weighted_design(counts)
 
     weights, extras = fit_weights_aggregated(
-        X_small, y_small, w_small, max_iter=args.max_iter, C=args.C, random_state=args.random_state
+        X_small, y_small, w_small, max_iter=args.max_iter, C=args.C
     )
 
     feature_weights = dict(zip(FEATURES, map(float, weights)))
@@ -1,9 +1,10 @@
 import argparse
 import json
 from pathlib import Path
+from typing import Iterator
 
-import numpy as np
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.dataset as ds
 
 RAW_COLS = {
@@ -37,68 +38,63 @@ OUT_FIELDS = [
 OUT_SCHEMA = pa.schema(OUT_FIELDS)
 
 
-def process(in_dir: Path, out_dir: Path, batch_size: int = 64_000) -> None:
+def process(in_dir: Path, out_dir: Path, batch_size: int = 262_144) -> None:
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    cols_needed = [PARTITION_COL, LABEL_COL] + [RAW_COLS[f] for f in USE_FEATS]
     dset = ds.dataset(str(in_dir), format="parquet", partitioning="hive")
-    scanner = dset.scanner(columns=cols_needed, batch_size=batch_size, use_threads=True)
+    # rows with a null label or a NaN in any used score are dropped by the scanner
+    filt = ds.field(LABEL_COL).is_valid()
+    for f in USE_FEATS:
+        filt = filt & ~pc.is_nan(ds.field(RAW_COLS[f]))
+
+    # binarization runs in the scanner projection; the float32 literal keeps the
+    # comparison in float32 instead of upcasting every score to double
+    def binary(f):
+        return (ds.field(RAW_COLS[f]) >= pa.scalar(TAU[f], pa.float32())).cast(pa.int8())
+
+    cols = {
+        PARTITION_COL: ds.field(PARTITION_COL),
+        LABEL_COL:     ds.field(LABEL_COL).cast(pa.int8()),
+        "bin_string_minhash": binary("STRING_MINHASH"),
+        "bin_code_regions":   binary("CODE_REGION_LIST"),
+        "bin_program_header": binary("PROGRAM_HEADER_VECTOR"),
+    }
+    # the single writer consumes batches as they come; a short readahead keeps the
+    # decoded-but-unwritten batches bounded
+    scanner = dset.scanner(columns=cols, filter=filt, batch_size=batch_size, use_threads=True,
+                           batch_readahead=2, fragment_readahead=2)
 
     fmt = ds.ParquetFileFormat()
     wopts = fmt.make_write_options(compression="snappy")
 
-    total_in = total_out = 0
-
-    for b in scanner.to_batches():
-        fam = b.column(0).to_numpy(zero_copy_only=False)
-        y   = b.column(1).to_numpy(zero_copy_only=False).astype(np.int8, copy=False)
-
-        mats = []
-        for i, f in enumerate(USE_FEATS, start=2):
-            mats.append(b.column(i).to_numpy(zero_copy_only=False).astype(np.float32, copy=False))
-        M = np.column_stack(mats) if mats else np.empty((len(y), 0), dtype=np.float32)
-
-        total_in += len(y)
-
-        if M.size:
-            mask_valid = np.all(~np.isnan(M), axis=1) & ~np.isnan(y)
-        else:
-            mask_valid = ~np.isnan(y)
-
-        if not np.any(mask_valid):
-            continue
-
-        fam = fam[mask_valid]
-        y   = y[mask_valid]
-        M   = M[mask_valid] if M.size else M
-
-        thr_vec = np.array([TAU[f] for f in USE_FEATS], dtype=np.float32)
-        B = (M >= thr_vec).astype(np.int8)
-
-        arrays = {
-            PARTITION_COL: pa.array(fam, type=pa.string()),
-            LABEL_COL:     pa.array(y,   type=pa.int8()),
-            "bin_string_minhash": pa.array(B[:, 0], type=pa.int8()),
-            "bin_code_regions":   pa.array(B[:, 1], type=pa.int8()),
-            "bin_program_header": pa.array(B[:, 2], type=pa.int8()),
-        }
-        table = pa.table(arrays, schema=OUT_SCHEMA)
-        total_out += table.num_rows
-
-        ds.write_dataset(
-            table,
-            base_dir=str(out_dir),
-            format=fmt,
-            partitioning=ds.partitioning(
-                pa.schema([pa.field(PARTITION_COL, pa.string())]),
-                flavor="hive"
-            ),
-            existing_data_behavior="overwrite_or_ignore",
-            file_options=wopts,
-            max_rows_per_file=2_000_000,
-            create_dir=True,
-            use_threads=True,
-        )
+    total_in = dset.count_rows()
+    total_out = 0
+
+    def counted(reader: pa.RecordBatchReader) -> Iterator[pa.RecordBatch]:
+        nonlocal total_out
+        for b in reader:
+            total_out += b.num_rows
+            yield b
+
+    reader = scanner.to_reader()
+    batches = pa.RecordBatchReader.from_batches(reader.schema, counted(reader))
+
+    # one writer for the whole run: partition files stay open and collect many row
+    # groups instead of being reopened (and part-0 overwritten) per scanner batch
+    ds.write_dataset(
+        batches,
+        base_dir=str(out_dir),
+        format=fmt,
+        partitioning=ds.partitioning(
+            pa.schema([pa.field(PARTITION_COL, pa.string())]),
+            flavor="hive"
+        ),
+        existing_data_behavior="overwrite_or_ignore",
+        file_options=wopts,
+        max_rows_per_file=2_000_000,
+        create_dir=True,
+        use_threads=True,
+    )
 
     meta = {
         "input_dir": str(in_dir),
@@ -124,7 +120,7 @@ def parse_args() -> argparse.Namespace:
     ap = argparse.ArgumentParser(description="Apply per-representation thresholds to Parquet and emit minimal binary features.")
     ap.add_argument("--in-dir",  type=Path, required=True, help="Input Parquet dataset (hive: src_family=...)")
     ap.add_argument("--out-dir", type=Path, required=True, help="Output Parquet dataset with binary features")
-    ap.add_argument("--batch-size", type=int, default=64_000, help="Scanner batch size")
+    ap.add_argument("--batch-size", type=int, default=262_144, help="Scanner batch size")
     return ap.parse_args()
 
 
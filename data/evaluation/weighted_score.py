@@ -0,0 +1,166 @@
+"""
+Shared weighted-score scan over the hive-partitioned rep Parquet dataset, used by
+train/final_threshold/find_threshold.py and test/plot/plot_roc.py. The negative
+subsampling, ROC helpers and Arrow pool sizing are also used by
+train/rep_threshold/find_thresholds.py and train/weight/find_weights.py.
+
+A row's weighted score is W_SM * [sm >= TAU_SM] + W_CR * [cr >= TAU_CR]
++ W_PH * [ph >= TAU_PH], so it only depends on a 3-bit pattern. The scanner
+computes that pattern in Arrow and SCORE_LUT maps it to the score; rows with a
+non-finite rep or a null label are dropped (strict mask).
+"""
+
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+FAMILY_COL = "src_family"
+LABEL_COL  = "label_same_family"
+COL_SM     = "rep_string_minhash"
+COL_CR     = "rep_code_regions"
+COL_PH     = "rep_program_header"
+
+TAU_SM = 0.146484375
+TAU_CR = 0.3988839387893677
+TAU_PH = 0.8291192054748535
+
+W_SM = 0.6170
+W_PH = 0.0884
+W_CR = 0.2946
+
+
+# weighted score per 3-bit pattern (bit0 = SM, bit1 = CR, bit2 = PH), summed in
+# float64 and rounded once, as the per-row sum was
+SCORE_LUT = np.array([(W_SM * (p & 1) + W_CR * (p >> 1 & 1)) + W_PH * (p >> 2 & 1) for p in range(8)],
+                     dtype=np.float32)
+
+def weighted_score_columns() -> tuple[dict, ds.Expression]:
+    # pattern and strict finite mask as scanner expressions, evaluated in Arrow;
+    # only one byte per row crosses into NumPy, where SCORE_LUT maps it to the score
+    def bit(col, tau, shift):
+        return pc.shift_left((ds.field(col) >= tau).cast(pa.int8()), shift)
+
+    pattern = pc.bit_wise_or(pc.bit_wise_or(bit(COL_SM, TAU_SM, 0), bit(COL_CR, TAU_CR, 1)),
+                             bit(COL_PH, TAU_PH, 2))
+    finite = (pc.is_finite(ds.field(COL_SM)) & pc.is_finite(ds.field(COL_CR))
+              & pc.is_finite(ds.field(COL_PH)) & ds.field(LABEL_COL).is_valid())
+    return {"pattern": pattern, "label": ds.field(LABEL_COL).cast(pa.int8())}, finite
+
+
+def subsample_negatives(y: np.ndarray, pos: int, neg: int,
+                        neg_pos_ratio: float) -> tuple[np.ndarray, int, int]:
+    # Streaming rule: keep every positive, keep a negative while kept negatives
+    # < positives seen so far * ratio. With cap_t = ceil(ratio * P_t) at the t-th
+    # negative (non-decreasing), kept count is K_t = t + min(neg, cummin(cap_t - t)).
+    is_pos = y == 1
+    keep = is_pos.copy()
+    neg_idx = np.flatnonzero(~is_pos)
+    if neg_idx.size:
+        p_at = pos + np.cumsum(is_pos)[neg_idx]
+        cap = np.ceil(p_at * neg_pos_ratio)
+        t = np.arange(1, neg_idx.size + 1)
+        k = t + np.minimum(neg, np.minimum.accumulate(cap - t))
+        keep[neg_idx[np.diff(k, prepend=neg) > 0]] = True
+        neg = int(k[-1])
+    return keep, pos + int(np.count_nonzero(is_pos)), neg
+
+
+def set_arrow_thread_pools() -> None:
+    # resizes Arrow's process-wide pools: call once from a script's main(), not per scan
+    # the scan is column-project + filter, so decode needs one thread per core; the I/O pool
+    # is oversubscribed so pre_buffer/readahead requests keep remote storage busy
+    cpus = os.cpu_count() or 1
+    pa.set_cpu_count(cpus)
+    pa.set_io_thread_count(min(16, cpus * 2))
+
+
+def scan_weighted_scores(dataset: ds.Dataset,
+                         family: str | None,
+                         neg_pos_ratio: float = 0.0,
+                         max_rows: int | None = None,
+                         batch_size: int = 16_384) -> tuple[np.ndarray, np.ndarray]:
+    cols, filt = weighted_score_columns()
+    if family:
+        filt = filt & (ds.field(FAMILY_COL) == family)
+    # pre_buffer coalesces the column-chunk reads of a row group into few large requests
+    scanner = dataset.scanner(columns=cols, filter=filt, batch_size=batch_size, use_threads=True,
+                              fragment_scan_options=ds.ParquetFragmentScanOptions(pre_buffer=True),
+                              fragment_readahead=8, batch_readahead=16)
+
+    # upper bound from Parquet metadata (the family is a partition key); counting with the
+    # finite filter would read the rep columns twice. With a row cap the loop stops within
+    # one batch of max_rows, so the buffers never need more than max_rows + batch_size.
+    cap = dataset.count_rows(filter=ds.field(FAMILY_COL) == family) if family else dataset.count_rows()
+    if max_rows:
+        cap = min(cap, max_rows + batch_size)
+    xs = np.empty(cap, np.float32)
+    ys = np.empty(cap, np.int8)
+
+    pos = neg = n = 0
+    for b in scanner.to_batches():
+        if b.num_rows == 0:
+            continue
+        pat = b.column(0).to_numpy(zero_copy_only=False)
+        y = b.column(1).to_numpy(zero_copy_only=False)
+
+        if neg_pos_ratio > 0:
+            keep, pos, neg = subsample_negatives(y, pos, neg, neg_pos_ratio)
+            pat, y = pat[keep], y[keep]
+
+        k = min(len(y), cap - n)
+        pat, y = pat[:k], y[:k]
+        np.take(SCORE_LUT, pat, out=xs[n:n + k])
+        ys[n:n + k] = y
+        n += k
+
+        if max_rows and n >= max_rows:
+            break
+
+    return ys[:n], xs[:n]
+
+
+def metrics_from_roc(fpr: np.ndarray, tpr: np.ndarray, thr: np.ndarray, i: int,
+                     pos: int, neg: int) -> dict:
+    # confusion counts at ROC point i follow from its rates; the curve already applies
+    # x >= thr[i], so no pass over the rows is needed
+    tp = int(round(tpr[i] * pos)) if pos else 0
+    fp = int(round(fpr[i] * neg)) if neg else 0
+    fn = pos - tp; tn = neg - fp
+    tpr_i = tp / pos if pos else 0.0
+    fpr_i = fp / neg if neg else 0.0
+    prec = tp / (tp + fp) if (tp + fp) else 0.0
+    return dict(threshold=float(thr[i]), tp=tp, fp=fp, tn=tn, fn=fn,
+                tpr=tpr_i, fpr=fpr_i, precision=prec)
+
+
+def roc_curve_discrete(y: np.ndarray, x: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """sklearn's roc_curve(y, x) for a score with few distinct values (the weighted
+    score has at most 8): hash-based unique + one bincount instead of sorting all rows."""
+    vals = np.sort(pc.unique(pa.array(x)).to_numpy(zero_copy_only=False))
+    b = np.searchsorted(vals, x)
+    cnt = np.bincount(b * 2 + (y == 1), minlength=2 * vals.size).reshape(-1, 2)[::-1]
+    fps = np.cumsum(cnt[:, 0]).astype(np.float64)
+    tps = np.cumsum(cnt[:, 1]).astype(np.float64)
+    thr = vals[::-1].astype(np.float64)
+    return roc_from_counts(fps, tps, thr)
+
+
+def roc_from_counts(fps: np.ndarray, tps: np.ndarray,
+                    thr: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # cumulative fp/tp counts at each distinct threshold (descending) -> roc_curve's output:
+    # same drop_intermediate rule and (0, 0)/inf start point
+    if fps.size > 2:
+        keep = np.flatnonzero(np.r_[True, np.logical_or(np.diff(fps, 2), np.diff(tps, 2)), True])
+        fps, tps, thr = fps[keep], tps[keep], thr[keep]
+    fps = np.r_[0.0, fps]; tps = np.r_[0.0, tps]; thr = np.r_[np.inf, thr]
+    fpr = fps / fps[-1] if fps[-1] > 0 else np.full(fps.shape, np.nan)
+    tpr = tps / tps[-1] if tps[-1] > 0 else np.full(tps.shape, np.nan)
+    return fpr, tpr, thr
+
+
+def auc(fpr: np.ndarray, tpr: np.ndarray) -> float:
+    # trapezoidal area; fpr is non-decreasing along the curve
+    return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1])) / 2.0)
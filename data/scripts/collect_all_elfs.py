@@ -1,3 +1,4 @@
+import os
 import shutil
 import logging
 from pathlib import Path
@@ -15,6 +16,15 @@ BUILDS_DIR = (SCRIPT_DIR / '..' / 'builds').resolve()
 
 DATASET_DIR = (SCRIPT_DIR / '..' / 'dataset' / 'Buildroot').resolve()
 
+def fast_copy(src: Path, dst: Path) -> None:
+    # the aggregated dataset is read-only downstream: a hard link on the same
+    # filesystem is O(1); other filesystems fall back to a full copy
+    try:
+        dst.unlink(missing_ok=True)
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
 def aggregate_elfs():
     DATASET_DIR.mkdir(parents=True, exist_ok=True)
     logger.info(f"Copying ELF binaries into {DATASET_DIR}")
@@ -31,7 +41,7 @@ def aggregate_elfs():
             new_name = f"{elf_file.stem}___{image_dir.name}{elf_file.suffix}"
             dest_path = DATASET_DIR / new_name
             try:
-                shutil.copy2(elf_file, dest_path)
+                fast_copy(elf_file, dest_path)
                 logger.info(f"Copied {elf_file.name} → {new_name}")
             except Exception as e:
                 logger.error(f"Failed to copy {elf_file}: {e}")
@@ -1,8 +1,8 @@
+import os
 import tarfile
 import shutil
 import logging
-import tempfile
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,13 +14,8 @@ logger = logging.getLogger(__name__)
 SCRIPT_DIR = Path(__file__).resolve().parent
 BUILDS_DIR = (SCRIPT_DIR / '..' / 'builds').resolve()
 
-
-def is_elf_file(path: Path) -> bool:
-    try:
-        with path.open('rb') as f:
-            return f.read(4) == b'\x7fELF'
-    except Exception:
-        return False
+ELF_MAGIC = b'\x7fELF'
+COPY_BUFSIZE = 1 << 20
 
 
 def extract_elfs_from_roots():
@@ -39,30 +34,40 @@ def extract_elfs_from_roots():
         elfs_dir.mkdir(exist_ok=True)
         logger.info(f"{image_dir.name}: writing to {elfs_dir}")
 
-        with tempfile.TemporaryDirectory(dir=image_dir) as tmpdir:
-            tmp_path = Path(tmpdir)
-            with tarfile.open(tar_path, 'r:*') as tar:
-                tar.extractall(path=tmp_path)
-
-            seen = {}
-            for src in tmp_path.rglob('*'):
-                if src.is_symlink() or not src.is_file():
+        # stream the members: only ELFs are written, nothing is extracted to a temp dir
+        seen = {}
+        with tarfile.open(tar_path, 'r:*') as tar:
+            for member in tar:
+                # hard links are included, as extractall materialized them as regular files
+                if not (member.isfile() or member.islnk()):
+                    continue
+                try:
+                    src = tar.extractfile(member)
+                except Exception as e:
+                    logger.warning(f"{image_dir.name}: failed to read {member.name}: {e}")
+                    continue
+                if src is None:
                     continue
-                if not is_elf_file(src):
+                head = src.read(4)
+                if head != ELF_MAGIC:
                     continue
 
-                base = src.name
+                base = PurePosixPath(member.name).name
                 count = seen.get(base, 0)
                 dest_name = f"{Path(base).stem}_{count}{Path(base).suffix}" if count else base
                 seen[base] = count + 1
 
                 dst_path = elfs_dir / dest_name
                 try:
-                    shutil.copy2(src, dst_path)
-                    rel = src.relative_to(tmp_path)
-                    logger.info(f"{image_dir.name}: extracted {rel} → elfs/{dest_name}")
+                    with dst_path.open('wb') as out:
+                        out.write(head)
+                        shutil.copyfileobj(src, out, length=COPY_BUFSIZE)
+                    # mode and mtime as shutil.copy2 kept them
+                    os.chmod(dst_path, member.mode & 0o7777)
+                    os.utime(dst_path, (member.mtime, member.mtime))
+                    logger.info(f"{image_dir.name}: extracted {member.name} → elfs/{dest_name}")
                 except Exception as e:
-                    logger.warning(f"{image_dir.name}: failed to copy {src}: {e}")
+                    logger.warning(f"{image_dir.name}: failed to copy {member.name}: {e}")
 
     logger.info("All done.")
 
@@ -1,4 +1,5 @@
 import argparse
+import os
 from collections import Counter, defaultdict
 from pathlib import Path
 import sys
@@ -21,16 +22,18 @@ def main():
 
     counts = Counter()
     members = defaultdict(list)
-    for path in src.iterdir():
-        if not path.is_file() or path.is_symlink():
-            continue
-        name = path.name
-        if '___' in name:
-            prefix = name.split('___', 1)[0]
-        else:
-            prefix = name
-        counts[prefix] += 1
-        members[prefix].append(name)
+    # DirEntry.is_file(follow_symlinks=False) answers from the directory listing,
+    # so regular files are picked out without a stat call per entry
+    with os.scandir(src) as it:
+        for entry in it:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            name = entry.name
+            prefix, sep, _ = name.partition('___')
+            if not sep:
+                prefix = name
+            counts[prefix] += 1
+            members[prefix].append(name)
 
     script_dir = Path(__file__).resolve().parent
     report_path = script_dir / 'family_report_test.txt'
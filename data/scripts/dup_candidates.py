@@ -0,0 +1,56 @@
+"""
+Shared helpers for find_duplicates.py and remove_duplicates.py: candidate
+grouping by size and leading bytes, and hashing of memory-mapped files.
+"""
+
+import hashlib
+import logging
+import mmap
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+HEAD_BYTES = 64 * 1024
+HASH_SLICE = 64 * 1024 * 1024
+
+def update_mapped(hasher, mm: mmap.mmap):
+    # hash the mapped file straight from the page cache: one C-level update per
+    # 64 MiB slice (a single call for most ELFs), each releasing the GIL
+    with memoryview(mm) as view:
+        for off in range(0, len(view), HASH_SLICE):
+            hasher.update(view[off:off + HASH_SLICE])
+    return hasher
+
+def head_hash(path) -> Optional[bytes]:
+    try:
+        with path.open('rb') as f:
+            return hashlib.blake2b(f.read(HEAD_BYTES)).digest()
+    except Exception as e:
+        logger.warning(f"Skipping {path}: could not read ({e})")
+        return None
+
+def candidate_groups(files) -> list:
+    """Groups of files that can still be duplicates: same size, and for files larger
+    than HEAD_BYTES also the same leading HEAD_BYTES. Singletons are never hashed.
+    Files that cannot be stat'ed or read are logged and dropped."""
+    by_size = {}
+    for p in files:
+        try:
+            by_size.setdefault(p.stat().st_size, []).append(p)
+        except OSError as e:
+            logger.warning(f"Skipping {p}: could not stat ({e})")
+
+    groups = []
+    for size, paths in by_size.items():
+        if len(paths) < 2:
+            continue
+        if size <= HEAD_BYTES:
+            groups.append(paths)
+            continue
+        by_head = {}
+        for p in paths:
+            h = head_hash(p)
+            if h is not None:
+                by_head.setdefault(h, []).append(p)
+        groups.extend(g for g in by_head.values() if len(g) > 1)
+    return groups
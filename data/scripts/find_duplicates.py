@@ -1,8 +1,13 @@
 import argparse
 import hashlib
 import logging
+import mmap
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from dup_candidates import candidate_groups, update_mapped
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s %(levelname)s: %(message)s',
@@ -11,11 +16,11 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 def compute_hash(path: Path, algorithm: str = 'md5') -> str:
-    hasher = hashlib.new(algorithm)
     with path.open('rb') as f:
-        for chunk in iter(lambda: f.read(8192), b''):
-            hasher.update(chunk)
-    return hasher.hexdigest()
+        if path.stat().st_size == 0:
+            return hashlib.new(algorithm).hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return update_mapped(hashlib.new(algorithm), mm).hexdigest()
 
 def find_duplicates(directory: Path, algorithm: str):
     if not directory.is_dir():
@@ -24,15 +29,20 @@ def find_duplicates(directory: Path, algorithm: str):
 
     hashes = {}
 
-    for file_path in directory.rglob('*'):
-        if not file_path.is_file():
-            continue
+    def try_hash(file_path: Path):
         try:
-            file_hash = compute_hash(file_path, algorithm)
+            return compute_hash(file_path, algorithm)
         except Exception as e:
             logger.warning(f"Skipping {file_path}: could not hash ({e})")
-            continue
-        hashes.setdefault(file_hash, []).append(file_path)
+            return None
+
+    files = (p for p in directory.rglob('*') if p.is_file())
+    candidates = [p for group in candidate_groups(files) for p in group]
+    # hashing releases the GIL, so candidate files are hashed on a thread pool
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        for file_path, file_hash in zip(candidates, ex.map(try_hash, candidates)):
+            if file_hash is not None:
+                hashes.setdefault(file_hash, []).append(file_path)
 
     has_duplicates = False
     for file_hash, paths in hashes.items():
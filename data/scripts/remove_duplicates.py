@@ -1,16 +1,34 @@
 import argparse
 import hashlib
 import logging
+import mmap
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+from dup_candidates import candidate_groups, update_mapped
+
+try:
+    import blake3
+    HAS_BLAKE3 = True
+except Exception:
+    HAS_BLAKE3 = False
+
+
 def compute_hash(path: Path) -> str:
     try:
-        hasher = hashlib.sha256()
+        if HAS_BLAKE3:
+            # SIMD hash over a memory map of the whole file; single-threaded, since
+            # main() already hashes one file per core on its thread pool
+            hasher = blake3.blake3()
+            hasher.update_mmap(path)
+            return hasher.hexdigest()
         with path.open('rb') as f:
-            for chunk in iter(lambda: f.read(8192), b''):
-                hasher.update(chunk)
-        return hasher.hexdigest()
+            if path.stat().st_size == 0:
+                return hashlib.sha256().hexdigest()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return update_mapped(hashlib.sha256(), mm).hexdigest()
     except Exception as e:
         logging.warning(f"Failed to hash file {path}: {e}")
         return None
@@ -18,7 +36,7 @@ def compute_hash(path: Path) -> str:
 
 def main():
     parser = argparse.ArgumentParser(
-        description="Remove exact duplicate files in a directory using SHA-256 hashes."
+        description="Remove exact duplicate files in a directory using BLAKE3 (or SHA-256) hashes."
     )
     parser.add_argument(
         'directory',
@@ -38,20 +56,25 @@ def main():
 
     report_dir  = args.directory.parent
     report_file = report_dir / 'duplicate_cleaner_report.txt'
-    with report_file.open('w') as report:
-        report.write(f"Duplicate Cleaner Report for: {args.directory}\n")
-        report.write("========================================\n\n")
-
+    # report lines are collected and written with one writelines call; the finally
+    # still writes what was collected if the run stops early
+    report: list[str] = [
+        f"Duplicate Cleaner Report for: {args.directory}\n",
+        "========================================\n\n",
+    ]
+    try:
         logging.info(f"Processing directory: {args.directory}")
-        report.write(f"Processing directory: {args.directory}\n\n")
+        report.append(f"Processing directory: {args.directory}\n\n")
 
         files = [p for p in args.directory.iterdir() if p.is_file()]
 
+        # hashing releases the GIL, so candidate files are hashed on a thread pool
+        candidates = [p for group in candidate_groups(files) for p in group]
         hash_map = {}
-        for file in files:
-            digest = compute_hash(file)
-            if digest:
-                hash_map.setdefault(digest, []).append(file)
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+            for file, digest in zip(candidates, ex.map(compute_hash, candidates)):
+                if digest:
+                    hash_map.setdefault(digest, []).append(file)
 
         removed_count = 0
 
@@ -60,22 +83,25 @@ def main():
                 paths_sorted = sorted(paths, key=lambda p: p.name)
                 kept = paths_sorted[0]
                 logging.info(f"Keeping file {kept} for hash {digest}")
-                report.write(f"Hash: {digest}\n")
-                report.write(f"  Kept: {kept.name}\n")
+                report.append(f"Hash: {digest}\n")
+                report.append(f"  Kept: {kept.name}\n")
                 for duplicate in paths_sorted[1:]:
                     try:
                         duplicate.unlink()
                         removed_count += 1
                         logging.info(f"Deleted duplicate {duplicate}")
-                        report.write(f"  Deleted: {duplicate.name}\n")
+                        report.append(f"  Deleted: {duplicate.name}\n")
                     except Exception as e:
                         logging.error(f"Failed to delete {duplicate}: {e}")
-                        report.write(f"  Failed to delete: {duplicate.name} ({e})\n")
-                report.write("\n")
+                        report.append(f"  Failed to delete: {duplicate.name} ({e})\n")
+                report.append("\n")
 
         summary = f"Duplicate removal complete. Removed {removed_count} files."
         print(summary)
-        report.write(summary + "\n")
+        report.append(summary + "\n")
+    finally:
+        with report_file.open('w') as f:
+            f.writelines(report)
 
     logging.info(f"Report written to {report_file}")
 